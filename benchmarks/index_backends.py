@@ -0,0 +1,93 @@
+"""
+Recall and latency of the index backends on synthetic embeddings.
+
+Gallery vectors are random unit vectors and every query is a noisy copy of a
+gallery vector, the way a new capture relates to a user's enrollment. Recall@1
+is measured against the exact backend, so the exact row is 1.0 by definition.
+
+Run from the repository root:
+
+    python -m benchmarks.index_backends --sizes 1000 10000 100000 --dim 512
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.index_backends import create_backend
+
+# Engine configurations to compare: (backend, options, num_trees)
+CONFIGS = [
+    ("exact", {}, 0),
+    ("annoy", {}, 10),
+    ("annoy", {"search_k": 1000}, 10),
+    ("annoy", {}, 50),
+    ("hnsw", {"ef": 32}, 0),
+    ("hnsw", {"ef": 128}, 0),
+]
+
+def make_data(size: int, dim: int, num_queries: int, noise: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+
+    gallery = rng.standard_normal((size, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+
+    targets = rng.integers(0, size, num_queries)
+    queries = gallery[targets] + noise * rng.standard_normal((num_queries, dim)).astype(np.float32)
+
+    return gallery, queries
+
+def run(name: str, options: dict, num_trees: int, gallery: np.ndarray, queries: np.ndarray, truth: np.ndarray):
+    try:
+        backend = create_backend(name, gallery.shape[1], **options)
+    except ImportError as e:
+        print(f"{name:<6} skipped: {e}")
+        return
+
+    start = time.perf_counter()
+
+    for id, vector in enumerate(gallery):
+        backend.add_item(id, vector.tolist())
+
+    backend.build(num_trees)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = [backend.get_nns_by_vector(query.tolist(), 1) for query in queries]
+    query_time = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    backend.get_nns_by_vectors(queries.tolist(), 1)
+    batch_time = (time.perf_counter() - start) / len(queries)
+
+    recall = np.mean([bool(ids) and ids[0] == t for ids, t in zip(found, truth)])
+    label = f"{name} {options or ''} {f'trees={num_trees}' if name == 'annoy' else ''}"
+
+    print(f"{label:<38} build {build_time:8.2f}s  query {query_time * 1e3:8.3f}ms  batched {batch_time * 1e3:8.3f}ms  recall@1 {recall:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        gallery, queries = make_data(size, args.dim, args.queries, args.noise)
+
+        exact = create_backend("exact", args.dim)
+
+        for id, vector in enumerate(gallery):
+            exact.add_item(id, vector.tolist())
+
+        truth = np.array([ids[0] for ids in exact.get_nns_by_vectors(queries.tolist(), 1)[0]])
+
+        print(f"\n{size} items, {args.dim} dims")
+
+        for name, options, num_trees in CONFIGS:
+            run(name, options, num_trees, gallery, queries, truth)
+
+if __name__ == "__main__":
+    main()
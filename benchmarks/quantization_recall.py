@@ -0,0 +1,97 @@
+"""
+Memory, load time and recall of the quantized index against float32 exact search.
+
+Every configuration is an AnnoyIndexManager, so the templates stored next to
+the index are part of the report: files and load time cover both the index and
+the float32 templates that candidates are re-scored against. The templates are
+memory-mapped, so memory counts the search engine and the templates' row index.
+
+Recall@1 is reported for the compressed first stage alone and after the top
+--rerank candidates are re-scored by AnnoyIndexManager.rescore.
+
+Run from the repository root:
+
+    python -m benchmarks.quantization_recall --size 100000 --dim 512 --templates 3
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils.annoy_index_manager import AnnoyIndexManager, index_files
+
+CONFIGS = [
+    ("exact", {}),
+    ("quantized", {"codec": "float16"}),
+    ("quantized", {"codec": "int8"}),
+    ("quantized", {"codec": "pq"}),
+]
+
+def index_nbytes(index) -> int:
+    """
+    Memory held by the search engine's arrays.
+    """
+
+    if hasattr(index, "nbytes"):
+        return index.nbytes()
+
+    return index.vectors.nbytes + (index.unit_vectors.nbytes if index.unit_vectors is not index.vectors else 0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--templates", type=int, default=3, help="Templates per user.")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--rerank", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    centres = rng.standard_normal((args.size, args.dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+
+    templates = centres[:, None, :] + args.noise * rng.standard_normal((args.size, args.templates, args.dim)).astype(np.float32)
+
+    targets = rng.integers(0, args.size, args.queries)
+    queries = centres[targets] + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    print(f"{args.size} users, {args.templates} templates each, {args.dim} dims, re-ranking the top {args.rerank}\n")
+
+    for name, options in CONFIGS:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.ann")
+
+            manager = AnnoyIndexManager(path, args.dim, backend=name, **options)
+
+            for id in range(args.size):
+                manager.set_templates(id, templates[id])
+
+            manager.rebuild(list(range(args.size)))
+
+            files_size = sum(os.path.getsize(file) for file in index_files(path) if os.path.exists(file))
+
+            start = time.perf_counter()
+            loaded = AnnoyIndexManager(path, args.dim, backend=name, **options)
+            load_time = time.perf_counter() - start
+
+            memory = index_nbytes(loaded.index) + loaded.templates.nbytes()
+
+            start = time.perf_counter()
+            ids, _ = loaded.get_ids_batch(queries.tolist(), args.rerank)
+            query_time = (time.perf_counter() - start) / args.queries
+
+            recall = np.mean([found[:1] == [target] for found, target in zip(ids, targets)])
+            recall_reranked = np.mean([loaded.rescore(query, found)[0][:1] == [target] for query, found, target in zip(queries, ids, targets)])
+
+        label = f"{name} {options.get('codec', 'float32')}"
+
+        print(f"{label:<20} files {files_size / 2 ** 20:8.1f}MiB  memory {memory / 2 ** 20:8.1f}MiB  "
+              f"load {load_time * 1e3:8.1f}ms  query {query_time * 1e3:7.3f}ms  recall@1 {recall:.3f}  re-ranked {recall_reranked:.3f}")
+
+if __name__ == "__main__":
+    main()
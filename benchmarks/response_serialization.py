@@ -0,0 +1,46 @@
+"""
+Serialization cost of user responses, before and after the orjson path.
+
+"jsonable_encoder" is what FastAPI did with the (dict, status) tuples that
+contained User objects: walk them with jsonable_encoder, then json.dumps.
+"orjson" is the current path: User.to_dict() projections rendered by
+FastJSONResponse.
+
+Run from the repository root:
+
+    python -m benchmarks.response_serialization --users 1000
+"""
+
+import argparse
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+
+from models.user import User
+from utils.response_manager import ResponseManager
+
+def old_path(users):
+    body = ({"success": True, "data": {"users": users}}, 200)
+
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def new_path(users):
+    return ResponseManager.success_response({"users": [user.to_dict() for user in users]}).body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="Number of users in the GET /db/users payload.")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    users = [User(id=i, firstname=f"First{i}", lastname=f"Last{i}") for i in range(args.users)]
+
+    for name, payload in [("GET /user/{userID}", users[:1]), ("GET /db/users", users)]:
+        old = min(timeit.repeat(lambda: old_path(payload), number=args.repeat, repeat=5)) / args.repeat
+        new = min(timeit.repeat(lambda: new_path(payload), number=args.repeat, repeat=5)) / args.repeat
+
+        print(f"{name:<20} jsonable_encoder {old * 1e6:10.1f}us  orjson {new * 1e6:10.1f}us  speedup {old / new:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,29 @@
 from __future__ import annotations
 
 import ipdb
-from typing import Generator, List
+from typing import Generator, List, Optional
 
-from fastapi import FastAPI, File, UploadFile, Depends
+from fastapi import FastAPI, File, Request, UploadFile, Depends
 from fastapi.responses import JSONResponse
 
 from sqlmodel import create_engine, Session
 
 import shutil
+import time
 import uuid
 from pathlib import Path
 
 import src.face_bio as face_bio
 import src.voice_bio as voice_bio
 
-from models.user import User, UserUpdate
+from models.user import User, UserUpdate, user_cache
+from utils.admission import AdmissionRejected
 from utils.errors import Error
 from utils.annoy_index_manager import AnnoyIndexManager
+from utils.sharded_index_manager import ShardedIndexManager
+from utils.fusion import ScoreFusion, LogisticFusion
 from utils.response_manager import ResponseManager
+from utils import timings
 
 UPLOAD_DIRECTORY = Path("uploads")
 UPLOAD_DIRECTORY.mkdir(exist_ok=True)
@@ -28,8 +33,35 @@ DATABASE_DIRECTORY.mkdir(exist_ok=True)
 
 DATABASE_URL = "sqlite:///db/users.db"
 
-index_face = AnnoyIndexManager("db/face_index.ann", face_bio.FACE_EMBEDDING_DIM)
-index_voice = AnnoyIndexManager("db/voice_index.ann", voice_bio.VOICE_EMBEDDING_DIM)
+# Number of centroid matches re-scored against every template of the user
+NUM_CANDIDATES = 5
+
+# Store the probe as an extra template after a successful authorization
+UPDATE_TEMPLATES_ON_AUTH = False
+
+# Search engine behind the indexes: "exact" for small galleries, "annoy" or "hnsw" for large ones
+INDEX_BACKEND = "annoy"
+
+# Number of shards each gallery is partitioned across, 1 keeps a single index file
+NUM_SHARDS = 1
+
+if NUM_SHARDS > 1:
+    index_face = ShardedIndexManager.local("db/face_index.ann", face_bio.FACE_EMBEDDING_DIM, NUM_SHARDS, backend=INDEX_BACKEND)
+    index_voice = ShardedIndexManager.local("db/voice_index.ann", voice_bio.VOICE_EMBEDDING_DIM, NUM_SHARDS, backend=INDEX_BACKEND)
+else:
+    index_face = AnnoyIndexManager("db/face_index.ann", face_bio.FACE_EMBEDDING_DIM, backend=INDEX_BACKEND)
+    index_voice = AnnoyIndexManager("db/voice_index.ann", voice_bio.VOICE_EMBEDDING_DIM, backend=INDEX_BACKEND)
+
+# Seconds an /authorize request may spend before its queued model work is dropped
+REQUEST_DEADLINE = 10.0
+
+# Routes that run the face anti-spoofing stage, remove a route to skip it, e.g. behind trusted kiosks
+ANTI_SPOOFING_ROUTES = {"/authorize", "/authorize/batch"}
+
+# Trained logistic fusion parameters, falls back to an equal-weight sum of the scores
+FUSION_PATH = "db/fusion.json"
+
+fusion = LogisticFusion.load(FUSION_PATH) or ScoreFusion()
 
 app = FastAPI()
 
@@ -66,6 +98,50 @@ def copy_temp_file(file: UploadFile, filename: str) -> Path:
 
     return path
 
+async def admitted(coro, *paths: Path):
+    """
+    Awaits model work, discarding the request's uploads if the work is refused.
+
+    Parameters:
+        coro (Coroutine): The model call.
+        *paths (Path): The uploads to delete if the call is refused.
+
+    Returns:
+        The result of the model call.
+    """
+
+    try:
+        return await coro
+    except AdmissionRejected:
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+        raise
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """
+    Reports the time spent in each model stage in a Server-Timing header.
+    """
+
+    stages = timings.start()
+    start = time.perf_counter()
+
+    response = await call_next(request)
+
+    stages["total"] = time.perf_counter() - start
+    response.headers["Server-Timing"] = timings.server_timing(stages)
+
+    return response
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    """
+    Answers saturated or late requests with 503 and a Retry-After header.
+    """
+
+    return ResponseManager.unavailable_response(exc.retry_after)
+
 @app.get("/")
 def home() -> JSONResponse:
     """
@@ -83,6 +159,7 @@ def home() -> JSONResponse:
 
 @app.post("/authorize")
 async def authorize(
+    request: Request,
     image: UploadFile = File(...),
     audio: UploadFile = File(...),
 
@@ -104,56 +181,138 @@ async def authorize(
     image_filename = f"{uuid.uuid4()}.{image_extension}"
     audio_filename = f"{uuid.uuid4()}.{audio_extension}"
 
+    deadline = time.monotonic() + REQUEST_DEADLINE
+
     image_path = copy_temp_file(image, image_filename)
     audio_path = copy_temp_file(audio, audio_filename)
 
-    pred_embs_voice = await voice_bio.get_embeddings(str(audio_path))
-    pred_embs_face = await face_bio.get_embeddings(str(image_path))
+    pred_embs_face = await admitted(face_bio.get_embeddings(str(image_path), deadline, request.url.path in ANTI_SPOOFING_ROUTES), image_path, audio_path)
 
-    if not pred_embs_voice or not pred_embs_face:
+    if not pred_embs_face:
         image_path.unlink()
         audio_path.unlink()
 
         return ResponseManager.get_error_response(Error.UNAUTHORIZED)
 
-    pred_voice_ids, _ = index_voice.get_ids(pred_embs_voice)
-    pred_face_ids, _ = index_face.get_ids(pred_embs_face)
+    pred_face_ids, _ = index_face.get_ids(pred_embs_face, NUM_CANDIDATES)
+    pred_face_ids, face_sims = index_face.rescore(pred_embs_face, pred_face_ids)
+    face_score = face_bio.calibrate_score(face_sims[0]) if pred_face_ids else 0.0
 
-    # The user exists and the IDs match
-    if pred_voice_ids and pred_face_ids:
-        pred_user_voice_embs = index_voice.get_vectors(pred_voice_ids[0])
-        pred_user_face_embs = index_face.get_vectors(pred_face_ids[0])
+    # A decisive face match settles the decision without running the voice model
+    if pred_face_ids and fusion.is_decisive(face_score) is True:
+        return authorize_user(session, pred_face_ids[0], None, pred_embs_face, image_path, audio_path)
 
-        is_same_voice = await voice_bio.is_same_speaker(pred_embs_voice, pred_user_voice_embs)
-        is_same_face = await face_bio.is_same_face(pred_embs_face, pred_user_face_embs)
+    pred_embs_voice = await admitted(voice_bio.get_embeddings(str(audio_path), deadline), image_path, audio_path)
 
-        # Check if the voice and face embeddings match
-        if (is_same_voice and is_same_face) and (pred_voice_ids[0] == pred_face_ids[0]):
-            user = User.get_user(session, pred_voice_ids[0])
+    if not pred_embs_voice:
+        image_path.unlink()
+        audio_path.unlink()
 
-            data = {
-                "user": user
-            }
+        return ResponseManager.get_error_response(Error.UNAUTHORIZED)
 
-            image_path.unlink()
-            audio_path.unlink()
+    pred_voice_ids, _ = index_voice.get_ids(pred_embs_voice, NUM_CANDIDATES)
+    pred_voice_ids, voice_sims = index_voice.rescore(pred_embs_voice, pred_voice_ids)
+    voice_score = voice_bio.calibrate_score(voice_sims[0]) if pred_voice_ids else 0.0
 
-            return ResponseManager.success_response(data)
-        
-        # The voice and face embeddings do not match, unauthorized access
-        elif is_same_voice or is_same_face:
-            image_path.unlink()
-            audio_path.unlink()
+    # The user exists, the IDs match and the fused score is high enough
+    if pred_voice_ids and pred_face_ids and pred_voice_ids[0] == pred_face_ids[0] and fusion.accept(face_score, voice_score):
+        return authorize_user(session, pred_face_ids[0], pred_embs_voice, pred_embs_face, image_path, audio_path)
 
-            return ResponseManager.get_error_response(Error.UNAUTHORIZED)
+    # Only one modality matches, unauthorized access
+    elif fusion.is_match(face_score) or fusion.is_match(voice_score):
+        image_path.unlink()
+        audio_path.unlink()
 
-        else:
-            # The user does not exist, create a new user
-            return create_user(session, pred_embs_voice, pred_embs_face, image_path, audio_path)
+        return ResponseManager.get_error_response(Error.UNAUTHORIZED)
 
     else: # The user does not exist, create a new user
         return create_user(session, pred_embs_voice, pred_embs_face, image_path, audio_path)
 
+@app.post("/authorize/batch")
+async def authorize_batch(
+    request: Request,
+    images: List[UploadFile] = File(...),
+    audios: List[UploadFile] = File(...),
+
+    session: Session = Depends(get_session)
+) -> JSONResponse:
+    """
+    Verifies several image/audio pairs at once.
+
+    Embeddings are extracted with one model invocation per modality and both
+    indexes are searched once for the whole batch. Pairs whose face score is
+    decisive skip the voice model. Unlike /authorize, unknown subjects are not
+    enrolled.
+
+    Parameters:
+        images (List[File]): The face images, one per subject.
+        audios (List[File]): The voice audios, in the same order as the images.
+
+    Returns:
+        JSONResponse: A JSON response with one result per pair, in order.
+    """
+
+    if len(images) != len(audios):
+        return ResponseManager.get_error_response(Error.BAD_REQUEST)
+
+    deadline = time.monotonic() + REQUEST_DEADLINE
+
+    image_paths = [copy_temp_file(image, f"{uuid.uuid4()}.{image.filename.split('.')[-1]}") for image in images]
+    audio_paths = [copy_temp_file(audio, f"{uuid.uuid4()}.{audio.filename.split('.')[-1]}") for audio in audios]
+
+    pred_embs_face = await admitted(
+        face_bio.get_embeddings_batch([str(path) for path in image_paths], deadline, request.url.path in ANTI_SPOOFING_ROUTES),
+        *image_paths, *audio_paths
+    )
+
+    results = [ResponseManager.error_body(Error.UNAUTHORIZED, Error.UNAUTHORIZED.message) for _ in images]
+
+    valid = [i for i in range(len(images)) if pred_embs_face[i]]
+    pred_face_ids, _ = index_face.get_ids_batch([pred_embs_face[i] for i in valid], NUM_CANDIDATES)
+
+    face_matches = {}
+
+    for i, face_ids in zip(valid, pred_face_ids):
+        face_ids, face_sims = index_face.rescore(pred_embs_face[i], face_ids)
+
+        if face_ids:
+            face_matches[i] = (face_ids[0], face_bio.calibrate_score(face_sims[0]))
+
+    # Pairs settled by the face alone are left out of the voice batch
+    undecided = []
+
+    for i, (user_id, face_score) in face_matches.items():
+        decision = fusion.is_decisive(face_score)
+
+        if decision is True:
+            results[i] = ResponseManager.success_body({"user": User.project(User.get_user(session, user_id))})
+        elif decision is None:
+            undecided.append(i)
+
+    pred_embs_voice = await admitted(
+        voice_bio.get_embeddings_batch([str(audio_paths[i]) for i in undecided], deadline),
+        *image_paths, *audio_paths
+    )
+
+    for path in image_paths + audio_paths:
+        path.unlink()
+
+    undecided = [(i, emb) for i, emb in zip(undecided, pred_embs_voice) if emb]
+    pred_voice_ids, _ = index_voice.get_ids_batch([emb for _, emb in undecided], NUM_CANDIDATES)
+
+    for (i, emb), voice_ids in zip(undecided, pred_voice_ids):
+        voice_ids, voice_sims = index_voice.rescore(emb, voice_ids)
+        user_id, face_score = face_matches[i]
+
+        if voice_ids and voice_ids[0] == user_id and fusion.accept(face_score, voice_bio.calibrate_score(voice_sims[0])):
+            results[i] = ResponseManager.success_body({"user": User.project(User.get_user(session, user_id))})
+
+    data = {
+        "results": results
+    }
+
+    return ResponseManager.success_response(data)
+
 @app.get("/db/users")
 def get_all_users(session: Session = Depends(get_session)) -> JSONResponse:
     """
@@ -169,7 +328,22 @@ def get_all_users(session: Session = Depends(get_session)) -> JSONResponse:
     users = User.get_all_users(session)
 
     data = {
-        "users": users
+        "users": [user.to_dict() for user in users]
+    }
+
+    return ResponseManager.success_response(data)
+
+@app.get("/db/cache")
+def get_cache_stats() -> JSONResponse:
+    """
+    Gets the user cache size and hit rate.
+
+    Returns:
+        JSONResponse: A JSON response containing the cache statistics.
+    """
+
+    data = {
+        "cache": user_cache.stats()
     }
 
     return ResponseManager.success_response(data)
@@ -191,7 +365,7 @@ def get_user(userID: int, session: Session = Depends(get_session)) -> JSONRespon
 
     if user:
         data = {
-            "user": user
+            "user": user.to_dict()
         }
 
         return ResponseManager.success_response(data)
@@ -218,7 +392,7 @@ def update_user(userID: int,
 
     if user:
         data = {
-            "user": user
+            "user": user.to_dict()
         }
 
         return ResponseManager.success_response(data)
@@ -277,7 +451,7 @@ def create_user(session: Session,
         audio_path.unlink()
 
         data = {
-            "user": new_user
+            "user": new_user.to_dict()
         }
 
         return ResponseManager.success_response(data)
@@ -286,4 +460,43 @@ def create_user(session: Session,
         image_path.unlink()
         audio_path.unlink()
 
-        return ResponseManager.get_error_response(Error.INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return ResponseManager.get_error_response(Error.INTERNAL_SERVER_ERROR)
+
+def authorize_user(session: Session,
+                   user_id: int,
+                   pred_embs_voice: Optional[List],
+                   pred_embs_face: List,
+                   image_path: Path,
+                   audio_path: Path) -> JSONResponse:
+    """
+    Logs in a user whose identity has been verified.
+
+    Parameters:
+        user_id (int): The ID of the verified user.
+        pred_embs_voice (Optional[List]): The voice embeddings of the user, or None if the voice model was skipped.
+        pred_embs_face (List): The face embeddings of the user.
+        image_path (Path): The path to the user's face image.
+        audio_path (Path): The path to the user's voice audio.
+
+    Returns:
+        JSONResponse: A JSON response indicating that the user has been logged in.
+    """
+
+    user = User.get_user(session, user_id)
+
+    if UPDATE_TEMPLATES_ON_AUTH:
+        all_ids = [existing.id for existing in User.get_all_users(session)]
+
+        if pred_embs_voice:
+            index_voice.add_template(user_id, pred_embs_voice, all_ids)
+
+        index_face.add_template(user_id, pred_embs_face, all_ids)
+
+    image_path.unlink()
+    audio_path.unlink()
+
+    data = {
+        "user": User.project(user)
+    }
+
+    return ResponseManager.success_response(data)
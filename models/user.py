@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import threading
+from collections import OrderedDict
+
 from fastapi import File
 from sqlmodel import SQLModel, Field, create_engine, Session, select
 
-from typing import Optional, List
+from typing import Dict, Optional, List
+
+USER_CACHE_SIZE = 10000
 
 class User(SQLModel, table=True):
     """
@@ -39,12 +44,46 @@ class User(SQLModel, table=True):
         session.commit()
         session.refresh(user)
 
+        user_cache.invalidate(id)
+
         return user
 
     @classmethod
     def get_user(cls, session: Session, user_id: int) -> Optional["User"]:
         """
-        Retrieves a user from the database.
+        Retrieves a user, from the cache if possible.
+
+        Cached users are detached copies for reading only. Use select_user to
+        get a session-bound user to modify.
+
+        Args:
+            session (Session): The database session.
+            user_id (int): The ID of the user to retrieve.
+
+        Returns:
+            User: The user with the given ID, or None if the user does not exist.
+        """
+
+        user = user_cache.get(user_id)
+
+        if user:
+            return user
+
+        # Taken before the read, so a write that lands meanwhile keeps its old row out of the cache
+        generation = user_cache.generation(user_id)
+        user = None
+
+        try:
+            user = cls.select_user(session, user_id)
+        finally:
+            user_cache.fill(user_id, generation, user)
+
+        return user
+
+    @classmethod
+    def select_user(cls, session: Session, user_id: int) -> Optional["User"]:
+        """
+        Retrieves a user from the database, bypassing the cache.
 
         Args:
             session (Session): The database session.
@@ -72,11 +111,12 @@ class User(SQLModel, table=True):
             bool: True if the user was deleted, False otherwise.
         """
 
-        user = cls.get_user(session, user_id)
+        user = cls.select_user(session, user_id)
 
         if user:
             session.delete(user)
             session.commit()
+            user_cache.invalidate(user_id)
             return True
 
         return False
@@ -95,7 +135,7 @@ class User(SQLModel, table=True):
             User: The updated user, or None if the user does not exist.
         """
 
-        user = cls.get_user(session, user_id)
+        user = cls.select_user(session, user_id)
 
         if user:
             for key, value in update_data.model_dump().items():
@@ -106,6 +146,8 @@ class User(SQLModel, table=True):
             session.commit()
             session.refresh(user)
 
+            user_cache.invalidate(user_id)
+
             return user
 
         return None
@@ -149,9 +191,153 @@ class User(SQLModel, table=True):
 
         return 1
 
+    def to_dict(self) -> dict:
+        """
+        Returns the user's public fields as a plain dict, ready for JSON serialization.
+
+        Returns:
+            dict: The user's id, firstname and lastname.
+        """
+
+        return {
+            "id": self.id,
+            "firstname": self.firstname,
+            "lastname": self.lastname
+        }
+
+    @staticmethod
+    def project(user: Optional[User]) -> Optional[dict]:
+        """
+        Returns to_dict() of a user that may be None.
+
+        Args:
+            user (Optional[User]): The user.
+
+        Returns:
+            Optional[dict]: The user's public fields, or None if there is no user.
+        """
+
+        return user.to_dict() if user else None
+
     def __str__(self) -> str:
         return f"ID: {self.id}, Name: {self.firstname} {self.lastname}"
 
+class UserCache:
+    """
+    A size-capped, least recently used, in-process cache of users.
+
+    The cache is invalidated by User.add_user, User.update_user and
+    User.delete_user. A read that misses takes the user's generation before
+    going to the database and hands it back to fill. Each invalidation bumps
+    the generation, and a fill carrying an older one is dropped, so a read that
+    raced with a write cannot cache the row from before it. Generations are
+    only kept while reads of the user are in flight. Each server process has
+    its own cache, so writes made by other processes are not seen until the
+    entry is evicted.
+
+    Attributes:
+        max_size (int): The maximum number of cached users.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups that went to the database.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self.users: OrderedDict[int, User] = OrderedDict()
+        # User ID -> [generation, reads in flight]
+        self.generations: Dict[int, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[User]:
+        with self.lock:
+            user = self.users.get(user_id)
+
+            if user is None:
+                self.misses += 1
+                return None
+
+            self.users.move_to_end(user_id)
+            self.hits += 1
+
+            return user
+
+    def generation(self, user_id: int) -> int:
+        """
+        Starts a read of a user from the database and returns the generation to pass to fill.
+        """
+
+        with self.lock:
+            entry = self.generations.setdefault(user_id, [0, 0])
+            entry[1] += 1
+
+            return entry[0]
+
+    def fill(self, user_id: int, generation: int, user: Optional[User]) -> None:
+        """
+        Ends a read started with generation, caching the user unless it was invalidated meanwhile.
+        """
+
+        with self.lock:
+            entry = self.generations[user_id]
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del self.generations[user_id]
+
+            if user is None or entry[0] != generation:
+                return
+
+            self._store(user)
+
+    def put(self, user: User) -> None:
+        """
+        Caches a user.
+        """
+
+        with self.lock:
+            self._store(user)
+
+    def invalidate(self, user_id: int) -> None:
+        with self.lock:
+            self.users.pop(user_id, None)
+
+            # Only reads in flight can race with the write
+            if user_id in self.generations:
+                self.generations[user_id][0] += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the cache size and hit rate.
+        """
+
+        with self.lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "size": len(self.users),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _store(self, user: User) -> None:
+        # Store a detached copy so the entry outlives the session it was loaded in
+        self.users[user.id] = User(**user.model_dump())
+        self.users.move_to_end(user.id)
+
+        while len(self.users) > self.max_size:
+            self.users.popitem(last=False)
+
+user_cache = UserCache()
+
 class UserUpdate(SQLModel):
     firstname: Optional[str]
     lastname: Optional[str]
\ No newline at end of file
@@ -3,60 +3,202 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
+import numpy as np
+
 from deepface import DeepFace
+from deepface.commons import image_utils
+from deepface.modules import preprocessing
+from deepface.spoofmodels.FasNet import crop as spoof_crop
+
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.fusion import calibrate
+from utils import timings
 
-from typing import List
+from typing import List, Optional
 
 FACE_EMBEDDING_DIM = 512
 
+# Cosine similarity that maps to a 0.5 score, the same as DeepFace's 0.30 cosine distance
+FACE_SCORE_THRESHOLD = 0.70
+FACE_SCORE_SCALE = 20.0
+
+# Maximum number of face model calls queued or running before new ones are rejected
+MAX_QUEUE_DEPTH = 16
+
 executor = ThreadPoolExecutor(max_workers=4)
+admission = AdmissionController(executor, MAX_QUEUE_DEPTH)
 
-async def get_embeddings(path : str) -> List:
+async def get_embeddings(path : str, deadline : Optional[float] = None, anti_spoofing : bool = True) -> List:
     """
-    Get the embeddings of the audio file.
+    Get the embeddings of the image file.
 
     Args:
-        path (str): The path to the audio file.
+        path (str): The path to the image file.
+        deadline (Optional[float]): The time.monotonic() time by which the result is needed.
+        anti_spoofing (bool): Whether to reject spoofed faces, skip it for trusted capture devices.
 
     Returns:
-        list: The embeddings of the
+        list: The embeddings of the face, or an empty list if no real face was found.
+
+    Raises:
+        AdmissionRejected: If the face model is saturated or the deadline passes.
     """
 
-    try:
-        emb_objs = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            partial(DeepFace.represent, path, model_name="Facenet512", detector_backend="retinaface", anti_spoofing=True)
-        )
+    embs = await get_embeddings_batch([path], deadline, anti_spoofing)
 
-        emb = emb_objs[0]["embedding"]
-    except Exception as e:
-        print(e)
+    return embs[0]
+
+def _detect_faces(paths : List[str]) -> List[Optional[dict]]:
+    """
+    Decode each image once and detect one face in it.
+
+    Args:
+        paths (List[str]): The paths to the image files.
+
+    Returns:
+        List[Optional[dict]]: Per image, the decoded BGR "image", the "facial_area" as (x, y, w, h) and the Facenet512 input "crop". None where no face was found.
+    """
+
+    target_size = DeepFace.build_model("Facenet512").input_shape
+    faces = []
+
+    for path in paths:
+        try:
+            img, _ = image_utils.load_image(path)
+
+            if img is None:
+                raise ValueError(f"Could not decode {path}.")
+
+            # Passing the decoded array keeps DeepFace from reading the file again
+            face_obj = DeepFace.extract_faces(img, detector_backend="retinaface")[0]
+            area = face_obj["facial_area"]
+
+            # The same preprocessing DeepFace.represent applies before the forward pass
+            crop = face_obj["face"][:, :, ::-1]
+            crop = preprocessing.resize_image(img=crop, target_size=(target_size[1], target_size[0]))
+            crop = preprocessing.normalize_input(img=crop, normalization="base")
+
+            faces.append({"image": img, "facial_area": (area["x"], area["y"], area["w"], area["h"]), "crop": crop})
+        except Exception as e:
+            print(e)
+            faces.append(None)
+
+    return faces
+
+def _embed_crops(crops : List[np.ndarray]) -> List[List]:
+    """
+    Embed preprocessed face crops with a single Facenet512 forward pass.
+    """
+
+    if not crops:
+        return []
+
+    model = DeepFace.build_model("Facenet512")
+
+    return model.model(np.concatenate(crops, axis=0), training=False).numpy().tolist()
+
+def _check_liveness(faces : List[dict]) -> List[bool]:
+    """
+    Run the Fasnet anti-spoofing models on several faces with one forward pass per model.
+
+    Mirrors Fasnet.analyze, which only takes one face at a time.
+
+    Args:
+        faces (List[dict]): Faces from _detect_faces.
+
+    Returns:
+        List[bool]: True for each face that is real.
+    """
+
+    if not faces:
         return []
 
-    return emb
+    import torch
+    import torch.nn.functional as F
+
+    model = DeepFace.build_model("Fasnet")
 
-async def is_same_face(emb_1 : List, emb_2 : List, threshold : float = 0.30) -> bool:
+    def batch(scale):
+        crops = np.stack([spoof_crop(face["image"], face["facial_area"], scale, 80, 80) for face in faces])
+
+        return torch.from_numpy(crops.transpose(0, 3, 1, 2)).float().to(model.device)
+
+    with torch.no_grad():
+        prediction = F.softmax(model.first_model.forward(batch(2.7)), dim=1).cpu().numpy()
+        prediction += F.softmax(model.second_model.forward(batch(4)), dim=1).cpu().numpy()
+
+    return (np.argmax(prediction, axis=1) == 1).tolist()
+
+async def _timed_run(stage : str, fn, deadline : Optional[float]):
+    with timings.timed(stage):
+        return await admission.run(fn, deadline)
+
+async def get_embeddings_batch(paths : List[str], deadline : Optional[float] = None, anti_spoofing : bool = True) -> List[List]:
     """
-    Compare two face embeddings to determine if they belong to the same person.
+    Get the embeddings of several image files with one Facenet512 invocation.
+
+    Each image is decoded and its face detected once. Anti-spoofing then runs
+    on the same faces concurrently with the embedding, and its latency is
+    recorded separately in the request timings.
 
     Args:
-        emb_1 (List): The first face embedding.
-        emb_2 (List): The second face embedding.
-        threshold (float): The threshold for the similarity score.
-    
+        paths (List[str]): The paths to the image files.
+        deadline (Optional[float]): The time.monotonic() time by which the result is needed.
+        anti_spoofing (bool): Whether to reject spoofed faces, skip it for trusted capture devices.
+
     Returns:
-        bool: True if the embeddings belong to the same person, False otherwise.
+        List[List]: The embeddings, in the order of the paths. Images where no real face was found get an empty list.
+
+    Raises:
+        AdmissionRejected: If the face model is saturated or the deadline passes.
     """
 
+    embs = [[] for _ in paths]
+
+    # An empty batch must not take a queue slot or be rejected
+    if not paths:
+        return embs
+
     try:
+        faces = await _timed_run("face_detect", partial(_detect_faces, paths), deadline)
+
+        positions = [i for i, face in enumerate(faces) if face is not None]
+        found = [faces[i] for i in positions]
+
+        if not found:
+            return embs
 
-        verify = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            partial(DeepFace.verify, emb_1, emb_2, model_name="Facenet512", detector_backend="retinaface", threshold=threshold, anti_spoofing=True)
-        )
+        stages = [_timed_run("face_embed", partial(_embed_crops, [face["crop"] for face in found]), deadline)]
 
+        if anti_spoofing:
+            stages.append(_timed_run("face_liveness", partial(_check_liveness, found), deadline))
+
+        results = await asyncio.gather(*stages)
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(e)
-        return False
+        return embs
+
+    live = results[1] if anti_spoofing else [True] * len(found)
+
+    for i, emb, is_real in zip(positions, results[0], live):
+        if is_real:
+            embs[i] = emb
+        else:
+            print(f"Spoof detected in {paths[i]}.")
+
+    return embs
+
+def calibrate_score(similarity : float) -> float:
+    """
+    Convert a Facenet512 cosine similarity to a calibrated match score.
+
+    Args:
+        similarity (float): The cosine similarity of two face embeddings.
+
+    Returns:
+        float: The calibrated score, between 0 and 1.
+    """
 
-    return verify['verified']
\ No newline at end of file
+    return calibrate(similarity, FACE_SCORE_THRESHOLD, FACE_SCORE_SCALE)
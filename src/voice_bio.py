@@ -1,6 +1,5 @@
 import os
 import ipdb
-import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
@@ -9,86 +8,171 @@ import torch
 
 from speechbrain.inference.speaker import SpeakerRecognition
 
-from typing import List, Tuple
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.fusion import calibrate
+from utils import timings
+
+from typing import List, Optional
 
 VOICE_EMBEDDING_DIM = 192
 
+# ECAPA cosine similarity that maps to a 0.5 score, the old speaker verification threshold
+VOICE_SCORE_THRESHOLD = 0.30
+VOICE_SCORE_SCALE = 15.0
+
 in_dir = "uploads"
 
 verification = SpeakerRecognition.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb",
                                                savedir="pretrained_voice_models/spkrec-ecapa-voxceleb")
 
+# Maximum number of voice model calls queued or running before new ones are rejected
+MAX_QUEUE_DEPTH = 16
+
 executor = ThreadPoolExecutor(max_workers=4)
+admission = AdmissionController(executor, MAX_QUEUE_DEPTH)
 
-async def get_embeddings(path : str) -> List:
+async def get_embeddings(path : str, deadline : Optional[float] = None) -> List:
     """
     Get the embeddings of the audio file.
 
     Args:
         path (str): The path to the audio file.
+        deadline (Optional[float]): The time.monotonic() time by which the result is needed.
 
     Returns:
         list: The embeddings of the
+
+    Raises:
+        AdmissionRejected: If the voice model is saturated or the deadline passes.
     """
 
     try:
-        waveform = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            partial(verification.load_audio, path, savedir=in_dir)
-        )
-        batch = waveform.unsqueeze(0)
-
-        emb = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            partial(verification.encode_batch, batch, None, normalize=False)
-        )
+        with timings.timed("voice_embed"):
+            waveform = await admission.run(
+                partial(verification.load_audio, path, savedir=in_dir),
+                deadline
+            )
+            batch = waveform.unsqueeze(0)
+
+            emb = await admission.run(
+                partial(verification.encode_batch, batch, None, normalize=False),
+                deadline
+            )
 
         emb = emb[0][0].tolist()
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(e)
         return []
 
     return emb
 
-def list_to_tensor(emb : List) -> torch.Tensor:
+def _load_audio(path : str) -> Optional[torch.Tensor]:
     """
-    Convert a list to a PyTorch tensor.
+    Load an audio file, returning None if it cannot be read.
 
     Args:
-        emb (List): The list to convert.
+        path (str): The path to the audio file.
 
     Returns:
-        torch.Tensor: The PyTorch tensor.
+        torch.Tensor: The waveform, or None on failure.
     """
 
-    return torch.tensor(emb)
+    try:
+        return verification.load_audio(path, savedir=in_dir)
+    except Exception as e:
+        print(e)
+        return None
 
-async def is_same_speaker(emb_1 : List, emb_2 : List, threshold : float = 0.30) -> Tuple[bool, float]:
+def _load_audios(paths : List[str]) -> List[Optional[torch.Tensor]]:
     """
-    Compare two face embeddings to determine if they belong to the same person.
+    Load several audio files, with None for the files that cannot be read.
 
     Args:
-        emb_1 (List): The first face embedding.
-        emb_2 (List): The second face embedding.
-        threshold (float): The threshold for the similarity score.
+        paths (List[str]): The paths to the audio files.
 
     Returns:
-        bool: True if the embeddings belong to the same person, False otherwise.
+        List[Optional[torch.Tensor]]: The waveforms, in the order of the paths.
     """
 
-    try:
-        # Convert lists to tensors
-        emb_1_tensor = list_to_tensor(emb_1)
-        emb_2_tensor = list_to_tensor(emb_2)
-        
-        # Run the blocking similarity operation in a separate thread
-        score = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            partial(verification.similarity, emb_1_tensor, emb_2_tensor)
+    return [_load_audio(path) for path in paths]
+
+def _encode_waveforms(waveforms : List[torch.Tensor]) -> torch.Tensor:
+    """
+    Pad waveforms of different lengths into one batch and encode it.
+
+    Args:
+        waveforms (List[torch.Tensor]): The waveforms to encode.
+
+    Returns:
+        torch.Tensor: The embeddings, with shape (batch, 1, VOICE_EMBEDDING_DIM).
+    """
+
+    lengths = torch.tensor([waveform.shape[0] for waveform in waveforms], dtype=torch.float)
+    batch = torch.nn.utils.rnn.pad_sequence(waveforms, batch_first=True)
+    wav_lens = lengths / lengths.max()
+
+    return verification.encode_batch(batch, wav_lens, normalize=False)
+
+async def get_embeddings_batch(paths : List[str], deadline : Optional[float] = None) -> List[List]:
+    """
+    Get the embeddings of several audio files with one ECAPA invocation.
+
+    Args:
+        paths (List[str]): The paths to the audio files.
+        deadline (Optional[float]): The time.monotonic() time by which the result is needed.
+
+    Returns:
+        List[List]: The embeddings, in the order of the paths. Failed files get an empty list.
+
+    Raises:
+        AdmissionRejected: If the voice model is saturated or the deadline passes.
+    """
+
+    # An empty batch must not take a queue slot or be rejected
+    if not paths:
+        return []
+
+    # Loading takes one queue slot for the whole batch, like the encoding below
+    with timings.timed("voice_embed"):
+        waveforms = await admission.run(
+            partial(_load_audios, paths),
+            deadline
         )
-        pred = score > threshold
+
+    positions = [i for i, waveform in enumerate(waveforms) if waveform is not None]
+    embs = [[] for _ in paths]
+
+    if not positions:
+        return embs
+
+    try:
+        with timings.timed("voice_embed"):
+            batch_embs = await admission.run(
+                partial(_encode_waveforms, [waveforms[i] for i in positions]),
+                deadline
+            )
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(e)
-        return False, 0.0
+        return embs
+
+    for i, emb in zip(positions, batch_embs):
+        embs[i] = emb[0].tolist()
+
+    return embs
+
+def calibrate_score(similarity : float) -> float:
+    """
+    Convert an ECAPA cosine similarity to a calibrated match score.
+
+    Args:
+        similarity (float): The cosine similarity of two voice embeddings.
+
+    Returns:
+        float: The calibrated score, between 0 and 1.
+    """
 
-    return pred.item()
\ No newline at end of file
+    return calibrate(similarity, VOICE_SCORE_THRESHOLD, VOICE_SCORE_SCALE)
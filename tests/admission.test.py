@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.admission import AdmissionController, AdmissionRejected, DeadlineExceeded
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown(wait=True)
+
+    def block(self) -> str:
+        self.release.wait(timeout=5)
+        return "done"
+
+    def test_run(self):
+        controller = AdmissionController(self.executor, max_queue=2)
+
+        self.release.set()
+        result = asyncio.run(controller.run(self.block))
+
+        self.assertEqual(result, "done")
+        self.assertEqual(controller.depth, 0)
+
+    def test_queue_full(self):
+        controller = AdmissionController(self.executor, max_queue=1, retry_after=3)
+
+        async def scenario():
+            running = asyncio.ensure_future(controller.run(self.block))
+            await asyncio.sleep(0.05)
+
+            with self.assertRaises(AdmissionRejected) as cm:
+                await controller.run(self.block)
+
+            self.assertEqual(cm.exception.retry_after, 3)
+
+            self.release.set()
+            return await running
+
+        self.assertEqual(asyncio.run(scenario()), "done")
+
+    def test_deadline_cancels_queued_work(self):
+        controller = AdmissionController(self.executor, max_queue=2)
+        ran = []
+
+        async def scenario():
+            # Occupies the only worker
+            running = asyncio.ensure_future(controller.run(self.block))
+            await asyncio.sleep(0.05)
+
+            with self.assertRaises(DeadlineExceeded):
+                await controller.run(lambda: ran.append(True), deadline=time.monotonic() + 0.05)
+
+            self.release.set()
+            await running
+
+        asyncio.run(scenario())
+        self.executor.shutdown(wait=True)
+
+        self.assertEqual(ran, [])
+        self.assertEqual(controller.depth, 0)
+
+    def test_deadline_passed(self):
+        controller = AdmissionController(self.executor, max_queue=2)
+
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(controller.run(self.block, deadline=time.monotonic() - 1))
+
+        self.assertEqual(controller.depth, 0)
+
+if __name__ == '__main__':
+    unittest.main()
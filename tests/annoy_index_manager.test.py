@@ -5,7 +5,7 @@ import unittest
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 
-from utils.annoy_index_manager import AnnoyIndexManager
+from utils.annoy_index_manager import AnnoyIndexManager, index_files
 
 class TestAnnoyIndexManager(unittest.TestCase):
     def setUp(self):
@@ -15,9 +15,20 @@ class TestAnnoyIndexManager(unittest.TestCase):
         self.index_manager = AnnoyIndexManager(self.index_path, self.vector_length, self.num_trees)
 
     def tearDown(self):
-        if os.path.exists(self.index_path):
-            os.remove(self.index_path)
+        for path in index_files(self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
     
+    def test_get_index_ids(self):
+        self.index_manager.add(0, [1.0, 0.0, 0.0, 0.0, 0.0], [])
+        self.index_manager.add(1, [0.0, 1.0, 0.0, 0.0, 0.0], [0])
+        self.index_manager.add(2, [0.0, 0.0, 1.0, 0.0, 0.0], [0, 1])
+        self.index_manager.delete(1, [0, 1, 2])
+
+        # Annoy keeps a zero vector in the gap left by the deleted id
+        self.assertEqual(self.index_manager.__sizeof__(), 3)
+        self.assertEqual(self.index_manager.get_index_ids(), [0, 2])
+
     def test_sizeof(self):
         # Empty index
         size = self.index_manager.__sizeof__()
@@ -111,5 +122,50 @@ class TestAnnoyIndexManager(unittest.TestCase):
 
         self.assertEqual(vectors, [])
 
+    def test_add_template(self):
+        id_1 = 0
+        vector_1 = [1.0, 0.0, 0.0, 0.0, 0.0]
+        vector_2 = [0.0, 1.0, 0.0, 0.0, 0.0]
+
+        self.index_manager.add(id_1, vector_1, [])
+
+        self.assertTrue(self.index_manager.add_template(id_1, vector_2, [id_1]))
+        self.assertEqual(len(self.index_manager.get_templates(id_1)), 2)
+
+        # Templates are capped per user, oldest first
+        for _ in range(self.index_manager.max_templates):
+            self.index_manager.add_template(id_1, vector_2, [id_1])
+
+        templates = self.index_manager.get_templates(id_1)
+
+        self.assertEqual(len(templates), self.index_manager.max_templates)
+        self.assertEqual(templates[0].tolist(), vector_2)
+
+        # Templates survive a reload
+        reloaded = AnnoyIndexManager(self.index_path, self.vector_length, self.num_trees)
+
+        self.assertEqual(len(reloaded.get_templates(id_1)), self.index_manager.max_templates)
+
+    def test_rescore(self):
+        # No candidates
+        self.assertEqual(self.index_manager.rescore([1.0, 0.0, 0.0, 0.0, 0.0], []), ([], []))
+
+        id_1 = 0
+        id_2 = 1
+
+        self.index_manager.add(id_1, [1.0, 0.0, 0.0, 0.0, 0.0], [])
+        self.index_manager.add(id_2, [0.0, 1.0, 0.0, 0.0, 0.0], [id_1])
+        self.index_manager.add_template(id_2, [0.0, 0.0, 1.0, 0.0, 0.0], [id_1, id_2])
+
+        ids, scores = self.index_manager.rescore([0.0, 0.0, 1.0, 0.0, 0.0], [id_1, id_2])
+
+        self.assertEqual(ids, [id_2, id_1])
+        self.assertAlmostEqual(scores[0], 1.0, places=5)
+
+        # Deleting a user drops their templates
+        self.index_manager.delete(id_2, [id_1, id_2])
+
+        self.assertEqual(len(self.index_manager.get_templates(id_2)), 0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from tests import model_stubs
+
+model_stubs.install()
+
+import src.face_bio as face_bio
+from utils import timings
+
+class FaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        model_stubs.CALLS.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def media(self, *contents):
+        paths = []
+
+        for i, content in enumerate(contents):
+            path = os.path.join(self.directory.name, f"{i}.jpg")
+
+            with open(path, "w") as f:
+                f.write(content)
+
+            paths.append(path)
+
+        return paths
+
+class TestFaceEmbeddingsBatch(FaceTestCase):
+    def embed(self, paths, **kwargs):
+        return asyncio.run(face_bio.get_embeddings_batch(paths, **kwargs))
+
+    def test_order(self):
+        embs = self.embed(self.media("3", "1", "2"))
+
+        self.assertEqual(embs, [model_stubs.subject_vector(id, model_stubs.FACE_DIM) for id in [3, 1, 2]])
+
+    def test_partial_failures(self):
+        # Images without a face and spoofed faces get an empty list, the others keep their position
+        embs = self.embed(self.media("none", "2", "-3", "4"))
+
+        self.assertEqual(embs[0], [])
+        self.assertEqual(embs[1], model_stubs.subject_vector(2, model_stubs.FACE_DIM))
+        self.assertEqual(embs[2], [])
+        self.assertEqual(embs[3], model_stubs.subject_vector(4, model_stubs.FACE_DIM))
+
+    def test_no_faces(self):
+        self.assertEqual(self.embed(self.media("none", "none")), [[], []])
+        self.assertNotIn(("face_embed", 0), model_stubs.CALLS)
+
+    def test_empty(self):
+        self.assertEqual(self.embed([]), [])
+        self.assertEqual(model_stubs.CALLS, [])
+
+    def test_single(self):
+        path, = self.media("5")
+
+        self.assertEqual(asyncio.run(face_bio.get_embeddings(path)), model_stubs.subject_vector(5, model_stubs.FACE_DIM))
+
+class TestFaceStages(FaceTestCase):
+    def embed(self, paths, **kwargs):
+        async def request():
+            stages = timings.start()
+            embs = await face_bio.get_embeddings_batch(paths, **kwargs)
+
+            return embs, stages
+
+        return asyncio.run(request())
+
+    def model_calls(self):
+        return sorted(call for call in model_stubs.CALLS if call[0] != "load_image")
+
+    def test_split(self):
+        paths = self.media("1", "none", "-2", "3")
+        embs, stages = self.embed(paths)
+
+        self.assertEqual([bool(emb) for emb in embs], [True, False, False, True])
+
+        # Each image is decoded and detected once, the faces found share one pass of every model
+        self.assertEqual([call for call in model_stubs.CALLS if call[0] == "load_image"], [("load_image", path) for path in paths])
+        self.assertEqual(self.model_calls(), [("face_embed", 3), ("face_liveness_first", 3), ("face_liveness_second", 3)])
+
+        self.assertEqual(set(stages), {"face_detect", "face_embed", "face_liveness"})
+
+    def test_without_anti_spoofing(self):
+        embs, stages = self.embed(self.media("1", "-2"), anti_spoofing=False)
+
+        # Spoofs are not checked, so they are embedded like real faces
+        self.assertEqual(embs, [model_stubs.subject_vector(id, model_stubs.FACE_DIM) for id in [1, 2]])
+        self.assertEqual(self.model_calls(), [("face_embed", 2)])
+
+        self.assertEqual(set(stages), {"face_detect", "face_embed"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.fusion import calibrate, ScoreFusion, LogisticFusion
+
+class TestScoreFusion(unittest.TestCase):
+    def test_calibrate(self):
+        self.assertAlmostEqual(calibrate(0.7, 0.7, 20.0), 0.5)
+        self.assertGreater(calibrate(0.9, 0.7, 20.0), 0.95)
+        self.assertLess(calibrate(0.5, 0.7, 20.0), 0.05)
+
+    def test_accept(self):
+        fusion = ScoreFusion()
+
+        self.assertTrue(fusion.accept(0.9, 0.6))
+        self.assertFalse(fusion.accept(0.2, 0.6))
+
+        # A strong modality can carry a borderline one
+        self.assertTrue(fusion.accept(0.95, 0.3))
+
+        # But not one that clearly belongs to someone else
+        self.assertFalse(fusion.accept(calibrate(0.85, 0.7, 20.0), calibrate(0.10, 0.3, 15.0)))
+        self.assertFalse(fusion.accept(1.0, 0.2))
+
+        # Without a floor only the fused score counts
+        self.assertTrue(ScoreFusion(modality_floor=None).accept(1.0, 0.2))
+
+    def test_is_decisive(self):
+        fusion = ScoreFusion(decisive_accept=0.99, decisive_reject=0.01)
+
+        self.assertTrue(fusion.is_decisive(0.995))
+        self.assertFalse(fusion.is_decisive(0.005))
+        self.assertIsNone(fusion.is_decisive(0.5))
+
+        # Both modalities are always used when the bounds are disabled
+        fusion = ScoreFusion(decisive_accept=None, decisive_reject=None)
+
+        self.assertIsNone(fusion.is_decisive(1.0))
+        self.assertIsNone(fusion.is_decisive(0.0))
+
+class TestLogisticFusion(unittest.TestCase):
+    def setUp(self):
+        self.fusion_path = 'test_fusion.json'
+
+    def tearDown(self):
+        if os.path.exists(self.fusion_path):
+            os.remove(self.fusion_path)
+
+    def test_fit(self):
+        face_scores = [0.9, 0.8, 0.95, 0.7, 0.1, 0.3, 0.2, 0.6]
+        voice_scores = [0.8, 0.9, 0.6, 0.85, 0.2, 0.1, 0.7, 0.1]
+        labels = [1, 1, 1, 1, 0, 0, 0, 0]
+
+        fusion = LogisticFusion.fit(face_scores, voice_scores, labels)
+
+        for face_score, voice_score, label in zip(face_scores, voice_scores, labels):
+            self.assertEqual(fusion.accept(face_score, voice_score), bool(label))
+
+    def test_save_load(self):
+        self.assertIsNone(LogisticFusion.load(self.fusion_path))
+
+        fusion = LogisticFusion([1.5, 0.5], -0.25)
+        fusion.save(self.fusion_path)
+
+        loaded = LogisticFusion.load(self.fusion_path)
+
+        self.assertEqual(loaded.weights, [1.5, 0.5])
+        self.assertEqual(loaded.bias, -0.25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,293 @@
+import os
+import sys
+
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.annoy_index_manager import AnnoyIndexManager, index_files
+from utils.index_backends import ExactBackend, HNSWBackend, IndexBackend, QuantizedBackend, create_backend, hnswlib
+from utils.quantization import Codec
+
+class TestExactBackend(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_exact_index.npz'
+        self.vector_length = 3
+        self.backend = ExactBackend(self.vector_length)
+
+    def tearDown(self):
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+    def test_get_nns_by_vector(self):
+        # Empty index
+        self.assertEqual(self.backend.get_nns_by_vector([1.0, 0.0, 0.0], 1), [])
+
+        self.backend.add_item(0, [1.0, 0.0, 0.0])
+        self.backend.add_item(1, [0.0, 1.0, 0.0])
+        self.backend.add_item(2, [1.0, 1.0, 0.0])
+        self.backend.build(0)
+
+        ids, dists = self.backend.get_nns_by_vector([1.0, 0.1, 0.0], 3, include_distances=True)
+
+        self.assertEqual(ids, [0, 2, 1])
+        self.assertEqual(dists, sorted(dists))
+
+        # More results than items
+        self.assertEqual(len(self.backend.get_nns_by_vector([1.0, 0.0, 0.0], 10)), 3)
+
+    def test_get_nns_by_vectors(self):
+        self.backend.add_item(0, [1.0, 0.0, 0.0])
+        self.backend.add_item(1, [0.0, 1.0, 0.0])
+
+        ids, _ = self.backend.get_nns_by_vectors([[0.0, 2.0, 0.0], [3.0, 0.0, 0.0]], 1)
+
+        self.assertEqual(ids, [[1], [0]])
+
+    def test_save_load(self):
+        self.backend.add_item(4, [1.0, 2.0, 3.0])
+        self.backend.save(self.index_path)
+
+        loaded = ExactBackend(self.vector_length)
+        loaded.load(self.index_path)
+
+        self.assertEqual(loaded.get_n_items(), 1)
+        self.assertEqual(loaded.get_item_vector(4), [1.0, 2.0, 3.0])
+
+    def test_create_backend(self):
+        self.assertIsInstance(create_backend("exact", self.vector_length), ExactBackend)
+
+        with self.assertRaises(ValueError):
+            create_backend("unknown", self.vector_length)
+
+class TestQuantizedBackend(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_quantized_index.npz'
+        self.vector_length = 4
+
+    def tearDown(self):
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+    def test_codecs(self):
+        for codec, options in [("float16", {}), ("int8", {}), ("pq", {"num_subspaces": 2})]:
+            backend = QuantizedBackend(self.vector_length, codec=codec, **options)
+
+            backend.add_item(0, [1.0, 0.0, 0.0, 0.0])
+            backend.add_item(1, [0.0, 1.0, 0.0, 0.0])
+            backend.add_item(2, [0.0, 0.0, 1.0, 1.0])
+            backend.build(0)
+            backend.train()
+
+            ids = backend.get_nns_by_vector([0.1, 0.9, 0.0, 0.0], 1)
+
+            self.assertEqual(ids, [1], codec)
+
+            backend.save(self.index_path)
+
+            loaded = QuantizedBackend(self.vector_length, codec=codec, **options)
+            loaded.load(self.index_path)
+
+            self.assertEqual(loaded.get_nns_by_vector([0.0, 0.0, 0.7, 0.7], 1), [2], codec)
+
+    def test_nbytes(self):
+        exact = ExactBackend(self.vector_length)
+        int8 = QuantizedBackend(self.vector_length, codec="int8")
+
+        for id in range(10):
+            exact.add_item(id, [float(id), 1.0, 2.0, 3.0])
+            int8.add_item(id, [float(id), 1.0, 2.0, 3.0])
+
+        exact.build(0)
+
+        self.assertLess(int8.nbytes(), exact.vectors.nbytes)
+
+class TestQuantizedIndexManager(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_quantized_index.ann'
+
+    def tearDown(self):
+        for path in index_files(self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_pq_trained_on_rebuild(self):
+        index_manager = AnnoyIndexManager(self.index_path, 16, backend="quantized", codec="pq", num_subspaces=4, iterations=5)
+        vectors = np.random.default_rng(0).normal(size=(60, 16))
+
+        # Until the first rebuild the codes are float16
+        for id, vector in enumerate(vectors[:40]):
+            self.assertTrue(index_manager.add(id, vector.tolist(), list(range(id))))
+
+        self.assertFalse(index_manager.index.codec.is_trained())
+
+        ids, _ = index_manager.get_ids_batch(vectors[:40].tolist(), 1)
+
+        self.assertEqual(ids, [[id] for id in range(40)])
+
+        # The rebuild trains the codebooks on the whole gallery
+        self.assertTrue(index_manager.rebuild(list(range(40))))
+
+        codebooks = index_manager.index.codec.codebooks
+
+        # Candidates are re-scored against full-precision templates
+        self.assertEqual(index_manager.get_templates(1).dtype, np.float32)
+
+        self.assertEqual(codebooks.shape, (4, 40, 4))
+
+        # Later writes encode with the frozen codebooks
+        for id, vector in enumerate(vectors[40:], 40):
+            self.assertTrue(index_manager.add(id, vector.tolist(), list(range(id))))
+
+        self.assertTrue(index_manager.delete(0, list(range(60))))
+        self.assertIs(index_manager.index.codec.codebooks, codebooks)
+
+        loaded = AnnoyIndexManager(self.index_path, 16, backend="quantized", codec="pq", num_subspaces=4, iterations=5)
+
+        np.testing.assert_array_equal(loaded.index.codec.codebooks, codebooks)
+
+        ids, _ = loaded.get_ids_batch(vectors[1:].tolist(), 1)
+        recall = np.mean([found == [id] for id, found in enumerate(ids, 1)])
+
+        self.assertGreaterEqual(recall, 0.9)
+
+@unittest.skipIf(hnswlib is None, "hnswlib is not installed")
+class TestHNSWBackend(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_hnsw_index.bin'
+        self.vector_length = 3
+        self.backend = HNSWBackend(self.vector_length, max_elements=2)
+
+    def tearDown(self):
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+    def test_save_load(self):
+        self.backend.add_item(0, [1.0, 0.0, 0.0])
+        self.backend.add_item(1, [0.0, 1.0, 0.0])
+        self.backend.save(self.index_path)
+
+        loaded = HNSWBackend(self.vector_length)
+        loaded.load(self.index_path)
+
+        self.assertEqual(sorted(loaded.get_item_ids()), [0, 1])
+        self.assertEqual(loaded.get_nns_by_vector([0.1, 1.0, 0.0], 1), [1])
+
+        # Inserts after loading grow the saved capacity
+        loaded.add_item(2, [0.0, 0.0, 1.0])
+
+        self.assertEqual(loaded.get_n_items(), 3)
+        self.assertEqual(loaded.get_nns_by_vector([0.0, 0.1, 1.0], 1), [2])
+
+    def test_incremental(self):
+        # Capacity is doubled as items arrive, and each item is searchable right away
+        for id in range(5):
+            self.backend.add_item(id, [1.0, float(id), 0.0])
+
+            self.assertEqual(self.backend.get_nns_by_vector([1.0, float(id), 0.0], 1), [id])
+
+        self.assertEqual(self.backend.get_n_items(), 5)
+
+    def test_load_other_format(self):
+        self.backend.add_item(0, [1.0, 0.0, 0.0])
+
+        with open(self.index_path, "wb") as f:
+            np.savez(f, ids=np.arange(3))
+
+        with self.assertRaises(RuntimeError):
+            self.backend.load(self.index_path)
+
+        # The graph in memory is kept intact
+        self.assertEqual(self.backend.get_n_items(), 1)
+        self.assertEqual(self.backend.get_nns_by_vector([1.0, 0.0, 0.0], 1), [0])
+
+class TestInterfaces(unittest.TestCase):
+    def test_incomplete_backend(self):
+        class SearchOnlyBackend(IndexBackend):
+            def get_nns_by_vector(self, vector, n, include_distances=False):
+                return []
+
+        with self.assertRaises(TypeError):
+            SearchOnlyBackend(3)
+
+    def test_incomplete_codec(self):
+        class EncodeOnlyCodec(Codec):
+            def encode(self, vectors):
+                return {"codes": vectors}
+
+        with self.assertRaises(TypeError):
+            EncodeOnlyCodec(3)
+
+class TestExactIndexManager(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_exact_index.ann'
+        self.index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+    def tearDown(self):
+        for path in index_files(self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_add_delete(self):
+        self.assertTrue(self.index_manager.add(0, [1.0, 0.0, 0.0], []))
+        self.assertTrue(self.index_manager.add(1, [0.0, 1.0, 0.0], [0]))
+
+        ids, _ = self.index_manager.get_ids([0.0, 1.0, 0.1])
+
+        self.assertEqual(ids, [1])
+
+        self.assertTrue(self.index_manager.delete(1, [0, 1]))
+
+        ids, _ = self.index_manager.get_ids([0.0, 1.0, 0.1])
+
+        self.assertEqual(ids, [0])
+        self.assertEqual(self.index_manager.get_vectors(1), [])
+
+    def test_switch_backend(self):
+        AnnoyIndexManager(self.index_path, 3, backend="annoy").add(0, [1.0, 0.0, 0.0], [])
+
+        # An index saved by another engine is rebuilt from the templates
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        ids, _ = index_manager.get_ids([1.0, 0.0, 0.0])
+
+        self.assertEqual(ids, [0])
+
+    @unittest.skipIf(hnswlib is None, "hnswlib is not installed")
+    def test_switch_to_hnsw(self):
+        AnnoyIndexManager(self.index_path, 3, backend="annoy").add(0, [1.0, 0.0, 0.0], [])
+
+        with open(self.index_path, "rb") as f:
+            saved = f.read()
+
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="hnsw")
+
+        # The index is rebuilt from the templates, but loading does not overwrite the file
+        self.assertEqual(index_manager.get_all_ids(), [0])
+
+        with open(self.index_path, "rb") as f:
+            self.assertEqual(f.read(), saved)
+
+        # The first write saves it in the new format
+        self.assertTrue(index_manager.add(1, [0.0, 1.0, 0.0], [0]))
+
+        ids, _ = index_manager.get_ids([0.0, 1.0, 0.1])
+
+        self.assertEqual(ids, [1])
+        self.assertEqual(AnnoyIndexManager(self.index_path, 3, backend="hnsw").get_index_ids(), [0, 1])
+
+    def test_unreadable_without_templates(self):
+        with open(self.index_path, "wb") as f:
+            f.write(b"not an index")
+
+        # There is nothing to rebuild from, so starting empty would lose every user
+        with self.assertRaises(Exception):
+            AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        with open(self.index_path, "rb") as f:
+            self.assertEqual(f.read(), b"not an index")
+
+if __name__ == '__main__':
+    unittest.main()
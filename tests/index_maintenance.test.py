@@ -0,0 +1,228 @@
+import os
+import sys
+import tempfile
+
+import unittest
+from unittest import mock
+
+from sqlmodel import Session, create_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from models.user import User
+from utils import index_maintenance
+from utils.annoy_index_manager import AnnoyIndexManager, index_files, read_backend
+from utils.index_maintenance import detect_shards, main, migrate, rebuild, recall, verify
+
+class TestIndexMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_maintenance_index.ann'
+        self.index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        self.index_manager.add(0, [1.0, 0.0, 0.0], [])
+        self.index_manager.add(1, [0.0, 1.0, 0.0], [0])
+        self.index_manager.add(2, [0.0, 0.0, 1.0], [0, 1])
+
+    def tearDown(self):
+        for path in index_files(self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_verify(self):
+        problems = verify(self.index_manager, [0, 1, 3])
+
+        self.assertEqual(problems["missing"], [3])
+        self.assertEqual(problems["orphaned"], [2])
+        self.assertEqual(problems["without_templates"], [])
+        self.assertEqual(problems["not_indexed"], [])
+
+    def test_verify_index_without_templates(self):
+        # Users enrolled before templates were stored only exist in the index
+        self.index_manager.templates.pop(2)
+        self.index_manager.templates[4] = self.index_manager.templates[0]
+
+        problems = verify(self.index_manager, [0, 1])
+
+        self.assertEqual(problems["orphaned"], [2])
+        self.assertEqual(problems["without_templates"], [2])
+        self.assertEqual(problems["not_indexed"], [4])
+
+    def test_rebuild_compacts(self):
+        results = rebuild({"face": self.index_manager}, [0, 1])
+
+        self.assertTrue(results["face"][0])
+        self.assertEqual(self.index_manager.get_all_ids(), [0, 1])
+        self.assertEqual(self.index_manager.__sizeof__(), 2)
+
+        # The compacted index is what is loaded next time
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        self.assertEqual(index_manager.get_all_ids(), [0, 1])
+
+    def test_rebuild_missing_ids(self):
+        # Users in the database that are in no index fail the rebuild
+        self.assertFalse(self.index_manager.rebuild([0, 1, 2, 3]))
+        self.assertEqual(self.index_manager.get_all_ids(), [0, 1, 2])
+
+    def test_set_templates(self):
+        self.index_manager.set_templates(0, [[0.0, 1.0, 0.1], [0.0, 1.0, -0.1]])
+        self.index_manager.rebuild([0, 1, 2])
+
+        ids, _ = self.index_manager.get_ids([0.0, 1.0, 0.0], 2)
+
+        self.assertEqual(sorted(ids), [0, 1])
+
+    def test_recall(self):
+        recall_1, recall_k, num_queries = recall(self.index_manager, [0, 1, 2], 10, 2)
+
+        self.assertEqual(num_queries, 3)
+        self.assertEqual(recall_1, 1.0)
+        self.assertEqual(recall_k, 1.0)
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.directory.name, 'index.ann')
+        self.user_ids = list(range(6))
+
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        for id in self.user_ids:
+            index_manager.add(id, [1.0, float(id), 0.0], self.user_ids[:id])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def reshard(self, num_shards):
+        index, stale = migrate(self.index_path, 3, "exact", 10, num_shards)
+
+        self.assertTrue(index.rebuild(self.user_ids))
+
+        for path in stale or []:
+            os.remove(path)
+
+        return index
+
+    def test_migrate(self):
+        self.assertEqual(detect_shards(self.index_path), 1)
+
+        for num_shards in [2, 3, 1]:
+            index = self.reshard(num_shards)
+
+            self.assertEqual(detect_shards(self.index_path), num_shards)
+            self.assertEqual(index.get_index_ids(), self.user_ids)
+            self.assertEqual(verify(index, self.user_ids)["missing"], [])
+
+            ids, _ = index.get_ids([1.0, 4.0, 0.0])
+
+            self.assertEqual(ids, [4])
+
+    def test_migrate_same_layout(self):
+        index, stale = migrate(self.index_path, 3, "exact", 10, 1)
+
+        self.assertIsNone(stale)
+        self.assertEqual(index.get_all_ids(), self.user_ids)
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.directory.name, 'face_index.ann')
+        self.database = f"sqlite:///{os.path.join(self.directory.name, 'users.db')}"
+
+        engine = create_engine(self.database)
+        User.metadata.create_all(engine)
+
+        with Session(engine) as session:
+            for id in range(3):
+                User.add_user(session, id)
+
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        for id in range(3):
+            index_manager.add(id, [1.0, float(id), 0.0], list(range(id)))
+
+        self.galleries = mock.patch.dict(index_maintenance.GALLERIES, {"face": (self.index_path, 3)})
+        self.galleries.start()
+
+    def tearDown(self):
+        self.galleries.stop()
+        self.directory.cleanup()
+
+    def run_main(self, *args):
+        main([*args, "--gallery", "face", "--database", self.database])
+
+    def snapshot(self):
+        files = {}
+
+        for path in index_files(self.index_path):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    files[path] = f.read()
+
+        return files
+
+    def test_read_only(self):
+        files = self.snapshot()
+
+        # The backend the index was saved with is used, and nothing is written
+        self.run_main("verify")
+        self.run_main("recall", "--k", "2")
+
+        self.assertEqual(self.snapshot(), files)
+
+    def test_backend_mismatch(self):
+        files = self.snapshot()
+
+        for command in ["verify", "recall"]:
+            with self.assertRaises(SystemExit):
+                self.run_main(command, "--backend", "annoy")
+
+        self.assertEqual(self.snapshot(), files)
+
+    def test_reembed_partial(self):
+        media_dir = os.path.join(self.directory.name, "media")
+
+        for id in [0, 1]:
+            os.makedirs(os.path.join(media_dir, str(id), "face"))
+
+            with open(os.path.join(media_dir, str(id), "face", "1.jpg"), "wb"):
+                pass
+
+        async def get_embeddings_batch(paths):
+            return [[0.0, 0.0, 1.0] for _ in paths]
+
+        face_bio = mock.Mock(get_embeddings_batch=get_embeddings_batch)
+        files = self.snapshot()
+
+        with mock.patch.dict(sys.modules, {"src.face_bio": face_bio}):
+            # User 2 has no media and would keep the old model's templates
+            with self.assertRaises(SystemExit) as exit:
+                self.run_main("reembed", "--media-dir", media_dir)
+
+            self.assertEqual(exit.exception.code, 1)
+            self.assertEqual(self.snapshot(), files)
+
+            self.run_main("reembed", "--media-dir", media_dir, "--allow-partial")
+
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        self.assertEqual(index_manager.get_templates(0).tolist(), [[0.0, 0.0, 1.0]])
+        self.assertEqual(index_manager.get_templates(2).tolist(), [[1.0, 2.0, 0.0]])
+
+    def test_convert_backend(self):
+        self.run_main("rebuild", "--backend", "annoy")
+
+        self.assertEqual(read_backend(self.index_path), ("annoy", {}))
+        self.assertEqual(AnnoyIndexManager(self.index_path, 3, backend="annoy").get_index_ids(), [0, 1, 2])
+
+        # Users without templates are carried over from the old index
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="annoy")
+        index_manager.templates.pop(2)
+        index_manager.save_index()
+
+        index_manager = AnnoyIndexManager(self.index_path, 3, backend="exact")
+
+        self.assertEqual(index_manager.get_index_ids(), [0, 1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import tempfile
+
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from tests import model_stubs
+
+model_stubs.install()
+
+from models.user import User, user_cache
+from utils.annoy_index_manager import AnnoyIndexManager
+
+FACE_DIM = model_stubs.FACE_DIM
+VOICE_DIM = model_stubs.VOICE_DIM
+
+# main.py creates its uploads, database and indexes in the working directory on import
+directory = tempfile.TemporaryDirectory()
+cwd = os.getcwd()
+
+def setUpModule():
+    global main
+
+    os.chdir(directory.name)
+
+    import main
+
+def tearDownModule():
+    os.chdir(cwd)
+    directory.cleanup()
+
+class TestAuthorizeBatch(unittest.TestCase):
+    def setUp(self):
+        self.index_face = AnnoyIndexManager(os.path.join(directory.name, "test_face.ann"), FACE_DIM, backend="exact")
+        self.index_voice = AnnoyIndexManager(os.path.join(directory.name, "test_voice.ann"), VOICE_DIM, backend="exact")
+
+        with Session(main.engine) as session:
+            for id in [1, 2, 3]:
+                if User.select_user(session, id) is None:
+                    User.add_user(session, id)
+
+                self.index_face.add(id, model_stubs.subject_vector(id, FACE_DIM), [1, 2, 3][:id - 1])
+                self.index_voice.add(id, model_stubs.subject_vector(id, VOICE_DIM), [1, 2, 3][:id - 1])
+
+        self.indexes = mock.patch.multiple(main, index_face=self.index_face, index_voice=self.index_voice)
+        self.indexes.start()
+
+        self.client = TestClient(main.app)
+
+        user_cache.clear()
+        model_stubs.CALLS.clear()
+
+    def tearDown(self):
+        self.indexes.stop()
+
+        for path in os.listdir(directory.name):
+            if path.startswith("test_"):
+                os.remove(os.path.join(directory.name, path))
+
+    def post(self, images, audios):
+        files = [("images", (f"{i}.jpg", content)) for i, content in enumerate(images)]
+        files += [("audios", (f"{i}.wav", content)) for i, content in enumerate(audios)]
+
+        return self.client.post("/authorize/batch", files=files)
+
+    def user_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+
+        return [result["data"]["user"]["id"] if result["success"] else result["error"]["code"] for result in response.json()["data"]["results"]]
+
+    def voice_calls(self):
+        return [call for call in model_stubs.CALLS if call[0] in ("load_audio", "voice_embed")]
+
+    def test_order(self):
+        response = self.post(["2", "1", "3"], ["2", "1", "3"])
+
+        self.assertEqual(self.user_ids(response), [2, 1, 3])
+        self.assertIn("Server-Timing", response.headers)
+
+        # One face model invocation for the whole batch
+        self.assertEqual([call for call in model_stubs.CALLS if call[0] == "face_embed"], [("face_embed", 3)])
+
+    def test_decisive_face_skips_voice(self):
+        response = self.post(["1", "2"], ["1", "3"])
+
+        # The voice would not match the second pair, but a decisive face settles it without the voice model
+        self.assertEqual(self.user_ids(response), [1, 2])
+        self.assertEqual(self.voice_calls(), [])
+
+    def test_undecided_pairs_use_voice(self):
+        response = self.post(["1", "2:0.8", "3:0.8"], ["1", "2", "1"])
+
+        self.assertEqual(self.user_ids(response), [1, 2, "unauthorized"])
+
+        # Only the undecided pairs are in the voice batch
+        self.assertEqual(len([call for call in self.voice_calls() if call[0] == "load_audio"]), 2)
+        self.assertIn(("voice_embed", 2), model_stubs.CALLS)
+
+    def test_partial_failures(self):
+        # No face, a match, a spoof, an undecided face with an unreadable voice, and a stranger
+        response = self.post(["none", "2", "-3", "1:0.8", "40"], ["1", "2", "3", "none", "40"])
+
+        self.assertEqual(self.user_ids(response), ["unauthorized", 2, "unauthorized", "unauthorized", "unauthorized"])
+
+        # Unknown subjects are not enrolled by the batch route
+        self.assertEqual(self.index_face.get_all_ids(), [1, 2, 3])
+        self.assertEqual(os.listdir(main.UPLOAD_DIRECTORY), [])
+
+    def test_mismatched_lengths(self):
+        response = self.post(["1", "2"], ["1"])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"success": False, "error": {"code": "bad_request", "message": "Bad request."}})
+        self.assertEqual(model_stubs.CALLS, [])
+
+if __name__ == '__main__':
+    unittest.main()
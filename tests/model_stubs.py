@@ -0,0 +1,169 @@
+"""
+Stand-ins for DeepFace and the speechbrain speaker model, so the biometric
+pipelines and the API can be tested without downloading or running models.
+
+Media files are text. "<subject>" embeds to the unit vector of that subject,
+"<subject>:<similarity>" to a vector with that cosine similarity to it, and
+"-<subject>" is a spoofed face. Files containing "none" have no face or
+cannot be decoded. Every model call is recorded in CALLS.
+
+Call install() before importing src.face_bio or src.voice_bio.
+"""
+
+import sys
+import types
+
+import numpy as np
+import torch
+
+FACE_DIM = 512
+VOICE_DIM = 192
+
+# (model, batch size) of every forward pass, and the paths passed to the decoders
+CALLS = []
+
+def parse(path):
+    with open(path) as f:
+        text = f.read().strip()
+
+    if "none" in text:
+        raise ValueError(f"No face or voice in {path}.")
+
+    subject, _, similarity = text.partition(":")
+
+    return float(subject), float(similarity or 1.0)
+
+def embedding(subject, similarity, dim):
+    """
+    Returns a unit vector with the given cosine similarity to the unit vector of the subject.
+    """
+
+    emb = np.zeros(dim, dtype=np.float32)
+    emb[int(subject)] = similarity
+    emb[dim - 1] = np.sqrt(max(1 - similarity ** 2, 0))
+
+    return emb
+
+def subject_vector(subject, dim):
+    return embedding(subject, 1.0, dim).tolist()
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def numpy(self):
+        return self.array
+
+class Facenet512:
+    input_shape = (160, 160)
+
+    def model(self, batch, training=False):
+        CALLS.append(("face_embed", len(batch)))
+
+        return FakeTensor(np.stack([embedding(abs(crop[1, 1, 0]), crop[0, 0, 0], FACE_DIM) for crop in batch]))
+
+class SpoofModel:
+    def __init__(self, name):
+        self.name = name
+
+    def forward(self, batch):
+        CALLS.append((self.name, len(batch)))
+
+        # Class 1 is a real face
+        real = torch.sign(batch[:, 0, 0, 0])
+
+        return torch.stack([-real, real, torch.zeros_like(real)], dim=1)
+
+class Fasnet:
+    device = "cpu"
+
+    def __init__(self):
+        self.first_model = SpoofModel("face_liveness_first")
+        self.second_model = SpoofModel("face_liveness_second")
+
+class DeepFace:
+    models = {"Facenet512": Facenet512(), "Fasnet": Fasnet()}
+
+    @classmethod
+    def build_model(cls, name):
+        return cls.models[name]
+
+    @staticmethod
+    def extract_faces(img, detector_backend="opencv"):
+        if not isinstance(img, np.ndarray):
+            raise TypeError("Expected a decoded image.")
+
+        return [{"face": img.astype(np.float32), "facial_area": {"x": 0, "y": 0, "w": img.shape[1], "h": img.shape[0]}}]
+
+def load_image(path):
+    CALLS.append(("load_image", path))
+
+    try:
+        subject, similarity = parse(path)
+    except ValueError:
+        return None, path
+
+    img = np.full((4, 4, 3), subject, dtype=np.float32)
+    img[0, 0] = similarity
+
+    return img, path
+
+def resize_image(img, target_size):
+    return img[None]
+
+def normalize_input(img, normalization="base"):
+    return img
+
+def spoof_crop(image, facial_area, scale, width, height):
+    return np.full((height, width, 3), np.sign(image[1, 1, 0]), dtype=np.float32)
+
+class SpeakerRecognition:
+    @classmethod
+    def from_hparams(cls, source, savedir):
+        return cls()
+
+    def load_audio(self, path, savedir=None):
+        CALLS.append(("load_audio", path))
+
+        subject, similarity = parse(path)
+
+        # Waveforms differ in length so batches need padding
+        waveform = torch.zeros(10 + int(subject))
+        waveform[0] = subject
+        waveform[1] = similarity
+
+        return waveform
+
+    def encode_batch(self, batch, wav_lens=None, normalize=False):
+        CALLS.append(("voice_embed", len(batch)))
+
+        embs = [embedding(waveform[0].item(), waveform[1].item(), VOICE_DIM) for waveform in batch]
+
+        return torch.from_numpy(np.stack(embs))[:, None, :]
+
+def module(name, **attributes):
+    stub = types.ModuleType(name)
+    stub.__dict__.update(attributes)
+
+    return stub
+
+def install():
+    """
+    Puts the stand-ins in sys.modules in place of deepface and speechbrain.
+    """
+
+    stubs = {
+        "deepface": module("deepface", DeepFace=DeepFace),
+        "deepface.commons": module("deepface.commons", image_utils=module("deepface.commons.image_utils", load_image=load_image)),
+        "deepface.modules": module("deepface.modules", preprocessing=module("deepface.modules.preprocessing", resize_image=resize_image, normalize_input=normalize_input)),
+        "deepface.spoofmodels": module("deepface.spoofmodels"),
+        "deepface.spoofmodels.FasNet": module("deepface.spoofmodels.FasNet", crop=spoof_crop),
+        "speechbrain": module("speechbrain"),
+        "speechbrain.inference": module("speechbrain.inference"),
+        "speechbrain.inference.speaker": module("speechbrain.inference.speaker", SpeakerRecognition=SpeakerRecognition),
+    }
+
+    stubs["deepface.commons.image_utils"] = stubs["deepface.commons"].image_utils
+    stubs["deepface.modules.preprocessing"] = stubs["deepface.modules"].preprocessing
+
+    sys.modules.update(stubs)
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from models.user import User
+from utils.errors import Error
+from utils.response_manager import ResponseManager
+
+class TestResponseManager(unittest.TestCase):
+    def test_success_response(self):
+        user = User(id=1, firstname="Ada", lastname="Lovelace")
+        response = ResponseManager.success_response({"user": user.to_dict(), "score": np.float32(0.5)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(
+            response.body,
+            b'{"success":true,"data":{"user":{"id":1,"firstname":"Ada","lastname":"Lovelace"},"score":0.5}}'
+        )
+
+    def test_success_response_model(self):
+        # Models passed without to_dict() still serialize through the fallback
+        response = ResponseManager.success_response({"user": User(id=1, firstname="Ada", lastname=None)})
+
+        self.assertEqual(response.body, b'{"success":true,"data":{"user":{"id":1,"firstname":"Ada","lastname":null}}}')
+
+    def test_error_response(self):
+        for error in [Error.USER_NOT_FOUND, Error.UNAUTHORIZED, Error.BAD_REQUEST]:
+            response = ResponseManager.get_error_response(error)
+
+            self.assertEqual(response.status_code, error.http_status)
+            self.assertEqual(
+                response.body,
+                f'{{"success":false,"error":{{"code":"{error.code}","message":"{error.message}"}}}}'.encode()
+            )
+
+    def test_unavailable_response(self):
+        response = ResponseManager.unavailable_response(3)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["retry-after"], "3")
+        self.assertEqual(
+            response.body,
+            b'{"success":false,"error":{"code":"service_unavailable","message":"Server is busy. Please try again later."}}'
+        )
+
+class TestUserProjection(unittest.TestCase):
+    def test_to_dict(self):
+        user = User(id=1, firstname="Ada", lastname="Lovelace")
+
+        self.assertEqual(user.to_dict(), {"id": 1, "firstname": "Ada", "lastname": "Lovelace"})
+
+    def test_project(self):
+        self.assertEqual(User.project(User(id=2, firstname=None, lastname=None)), {"id": 2, "firstname": None, "lastname": None})
+        self.assertIsNone(User.project(None))
+
+if __name__ == '__main__':
+    unittest.main()
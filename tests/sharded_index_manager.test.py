@@ -0,0 +1,109 @@
+import os
+import sys
+import glob
+import multiprocessing
+
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.sharded_index_manager import ShardedIndexManager
+from utils.shard_server import serve_shard
+
+AUTHKEY = b"test"
+
+class TestShardedIndexManager(unittest.TestCase):
+    def setUp(self):
+        self.index_path = 'test_sharded_index.ann'
+        self.index_manager = ShardedIndexManager.local(self.index_path, 3, num_shards=2, backend="exact")
+
+    def tearDown(self):
+        for path in glob.glob('test_sharded_index.shard*'):
+            os.remove(path)
+
+    def test_shard_for(self):
+        self.assertEqual(self.index_manager.shard_for(4), 0)
+        self.assertEqual(self.index_manager.shard_for(5), 1)
+
+        ranged = ShardedIndexManager(self.index_manager.shards, partition="range", shard_size=10)
+
+        self.assertEqual(ranged.shard_for(9), 0)
+        self.assertEqual(ranged.shard_for(10), 1)
+        self.assertEqual(ranged.shard_for(1000), 1)
+
+    def test_get_ids(self):
+        # Empty index
+        self.assertEqual(self.index_manager.get_ids([1.0, 0.0, 0.0]), ([], []))
+
+        self.index_manager.add(0, [1.0, 0.0, 0.0], [])
+        self.index_manager.add(1, [0.0, 1.0, 0.0], [0])
+        self.index_manager.add(2, [0.0, 0.0, 1.0], [0, 1])
+
+        # Each user is written to one shard only
+        self.assertEqual(self.index_manager.shards[0].__sizeof__(), 2)
+        self.assertEqual(self.index_manager.shards[1].__sizeof__(), 1)
+
+        ids, dists = self.index_manager.get_ids([0.1, 1.0, 0.0], 2)
+
+        self.assertEqual(ids[0], 1)
+        self.assertEqual(dists, sorted(dists))
+
+        ids, _ = self.index_manager.get_ids_batch([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+
+        self.assertEqual(ids, [[0], [2]])
+
+        ids, scores = self.index_manager.rescore([0.0, 0.0, 1.0], [0, 1, 2])
+
+        self.assertEqual(ids[0], 2)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_delete(self):
+        self.index_manager.add(0, [1.0, 0.0, 0.0], [])
+        self.index_manager.add(1, [0.0, 1.0, 0.0], [0])
+
+        self.assertTrue(self.index_manager.delete(1, [0, 1]))
+
+        ids, _ = self.index_manager.get_ids([0.0, 1.0, 0.0])
+
+        self.assertEqual(ids, [0])
+
+class TestRemoteShards(unittest.TestCase):
+    def setUp(self):
+        self.processes = []
+        addresses = []
+
+        ready = multiprocessing.Queue()
+
+        for i in range(2):
+            process = multiprocessing.Process(
+                target=serve_shard,
+                args=(("127.0.0.1", 0), AUTHKEY, f"test_remote_index.shard{i}.ann", 3),
+                kwargs={"ready": ready, "backend": "exact"},
+                daemon=True
+            )
+            process.start()
+
+            self.processes.append(process)
+            addresses.append(ready.get(timeout=30))
+
+        self.index_manager = ShardedIndexManager.remote(addresses, AUTHKEY)
+
+    def tearDown(self):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+        for path in glob.glob('test_remote_index.shard*'):
+            os.remove(path)
+
+    def test_remote(self):
+        self.assertTrue(self.index_manager.add(0, [1.0, 0.0, 0.0], []))
+        self.assertTrue(self.index_manager.add(1, [0.0, 1.0, 0.0], [0]))
+
+        ids, _ = self.index_manager.get_ids([0.0, 1.0, 0.1])
+
+        self.assertEqual(ids, [1])
+        self.assertEqual(self.index_manager.__sizeof__(), 2)
+
+if __name__ == '__main__':
+    unittest.main()
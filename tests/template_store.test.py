@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.template_store import TemplateStore
+
+class TestTemplateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'index.templates.npy')
+        self.store = TemplateStore(self.path, 3)
+
+        self.store[2] = [[0.0, 0.0, 1.0]]
+        self.store[0] = [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]]
+        self.store[1] = [[0.0, 1.0, 0.0]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_load(self):
+        self.store.save()
+
+        loaded = TemplateStore(self.path, 3)
+        loaded.load()
+
+        # The vectors stay on disk, only the rows that are read are copied
+        self.assertIsInstance(loaded.disk[3], np.memmap)
+        self.assertEqual(loaded.changed, {})
+
+        self.assertEqual(sorted(loaded), [0, 1, 2])
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded[0].dtype, np.float32)
+        np.testing.assert_array_equal(loaded[0], np.float32([[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]]))
+        np.testing.assert_array_equal(loaded[2], np.float32([[0.0, 0.0, 1.0]]))
+
+        with self.assertRaises(KeyError):
+            loaded[3]
+
+    def test_changes_after_save(self):
+        self.store.save()
+
+        self.store[1] = [[0.0, 1.0, 1.0]]
+        self.store[5] = [[1.0, 1.0, 1.0]]
+        del self.store[0]
+
+        self.assertNotIn(0, self.store)
+        self.assertEqual(sorted(self.store), [1, 2, 5])
+        np.testing.assert_array_equal(self.store[1], np.float32([[0.0, 1.0, 1.0]]))
+
+        with self.assertRaises(KeyError):
+            del self.store[0]
+
+        # A deleted user can be enrolled again
+        self.store[0] = [[0.5, 0.5, 0.0]]
+
+        self.assertIn(0, self.store)
+
+        self.store.save()
+
+        self.assertEqual(sorted(self.store), [0, 1, 2, 5])
+        np.testing.assert_array_equal(self.store[0], np.float32([[0.5, 0.5, 0.0]]))
+        np.testing.assert_array_equal(self.store[5], np.float32([[1.0, 1.0, 1.0]]))
+
+    def test_empty(self):
+        store = TemplateStore(self.path, 3)
+        store.save()
+        store.load()
+
+        self.assertEqual(len(store), 0)
+        self.assertNotIn(0, store)
+
+    def test_legacy(self):
+        legacy_path = TemplateStore.files(self.path)[2]
+
+        np.savez(legacy_path, ids=np.array([1, 0, 1]), vectors=np.float32([[0, 1, 0], [1, 0, 0], [0, 1, 1]]))
+
+        store = TemplateStore(self.path, 3)
+        store.load()
+
+        np.testing.assert_array_equal(store[1], np.float32([[0, 1, 0], [0, 1, 1]]))
+
+        # The templates move to the mapped files on the next save
+        store.save()
+
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertEqual(sorted(store), [0, 1])
+        np.testing.assert_array_equal(store[1], np.float32([[0, 1, 0], [0, 1, 1]]))
+
+if __name__ == '__main__':
+    unittest.main()
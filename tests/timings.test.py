@@ -0,0 +1,39 @@
+import os
+import sys
+import asyncio
+
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils import timings
+
+class TestTimings(unittest.TestCase):
+    def test_record_outside_request(self):
+        # Nothing to record into, and nothing breaks
+        timings.record("face_embed", 1.0)
+
+    def test_concurrent_stages(self):
+        async def stage(name):
+            with timings.timed(name):
+                await asyncio.sleep(0.01)
+
+        async def request():
+            stages = timings.start()
+            await asyncio.gather(stage("face_embed"), stage("face_liveness"))
+            timings.record("face_embed", 1.0)
+
+            return stages
+
+        stages = asyncio.run(request())
+
+        self.assertEqual(set(stages), {"face_embed", "face_liveness"})
+        self.assertGreater(stages["face_embed"], 1.0)
+
+    def test_server_timing(self):
+        header = timings.server_timing({"face_detect": 0.0123, "total": 0.5})
+
+        self.assertEqual(header, "face_detect;dur=12.3, total;dur=500.0")
+
+if __name__ == '__main__':
+    unittest.main()
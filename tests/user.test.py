@@ -0,0 +1,102 @@
+import os
+import sys
+
+import unittest
+
+from sqlmodel import Session, create_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from models.user import User, UserCache, UserUpdate, user_cache
+
+class TestUserCache(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        User.metadata.create_all(self.engine)
+
+        self.session = Session(self.engine)
+        User.add_user(self.session, 1)
+
+        user_cache.clear()
+        user_cache.hits = 0
+        user_cache.misses = 0
+
+    def tearDown(self):
+        self.session.close()
+        user_cache.clear()
+
+    def test_hit_and_miss(self):
+        self.assertEqual(User.get_user(self.session, 1).id, 1)
+        self.assertEqual(User.get_user(self.session, 1).id, 1)
+
+        stats = user_cache.stats()
+
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+
+    def test_update_invalidates(self):
+        User.get_user(self.session, 1)
+        User.update_user(self.session, 1, UserUpdate(firstname="Ada", lastname="Lovelace"))
+
+        self.assertEqual(User.get_user(self.session, 1).firstname, "Ada")
+
+    def test_delete_invalidates(self):
+        User.get_user(self.session, 1)
+
+        self.assertTrue(User.delete_user(self.session, 1))
+        self.assertIsNone(User.get_user(self.session, 1))
+
+    def test_add_invalidates(self):
+        # A stale entry left behind for an id that is enrolled again
+        user_cache.put(User(id=2, firstname="Old"))
+        User.add_user(self.session, 2)
+
+        self.assertIsNone(User.get_user(self.session, 2).firstname)
+
+    def test_stale_put_dropped(self):
+        # A read that started before a write must not cache the old row
+        generation = user_cache.generation(1)
+        stale = User.select_user(self.session, 1)
+
+        User.update_user(self.session, 1, UserUpdate(firstname="Ada", lastname=None))
+        user_cache.fill(1, generation, stale)
+
+        self.assertIsNone(user_cache.get(1))
+        self.assertEqual(User.get_user(self.session, 1).firstname, "Ada")
+
+    def test_generations_pruned(self):
+        # Generations are dropped once no read of the user is in flight
+        for id in range(1, 4):
+            User.get_user(self.session, id)
+            User.update_user(self.session, id, UserUpdate(firstname="Ada", lastname=None))
+
+        self.assertEqual(user_cache.generations, {})
+
+        first = user_cache.generation(1)
+        second = user_cache.generation(1)
+
+        user_cache.fill(1, first, None)
+
+        self.assertEqual(user_cache.generations, {1: [0, 1]})
+
+        user_cache.fill(1, second, User.select_user(self.session, 1))
+
+        self.assertEqual(user_cache.generations, {})
+        self.assertEqual(user_cache.get(1).firstname, "Ada")
+
+    def test_size_cap(self):
+        cache = UserCache(max_size=2)
+
+        for id in range(3):
+            cache.put(User(id=id))
+
+        cache.get(1)
+        cache.put(User(id=3))
+
+        # The least recently used entries are evicted first
+        self.assertIsNone(cache.get(0))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1).id, 1)
+        self.assertEqual(cache.stats()["size"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
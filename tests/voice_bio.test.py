@@ -0,0 +1,63 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from tests import model_stubs
+
+model_stubs.install()
+
+import src.voice_bio as voice_bio
+
+class TestVoiceEmbeddingsBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        model_stubs.CALLS.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def media(self, *contents):
+        paths = []
+
+        for i, content in enumerate(contents):
+            path = os.path.join(self.directory.name, f"{i}.wav")
+
+            with open(path, "w") as f:
+                f.write(content)
+
+            paths.append(path)
+
+        return paths
+
+    def embed(self, paths):
+        return asyncio.run(voice_bio.get_embeddings_batch(paths))
+
+    def test_order(self):
+        embs = self.embed(self.media("3", "1", "2"))
+
+        for emb, id in zip(embs, [3, 1, 2]):
+            self.assertEqual(len(emb), model_stubs.VOICE_DIM)
+            self.assertAlmostEqual(emb[id], 1.0)
+
+        # Waveforms of different lengths are padded into a single forward pass
+        self.assertEqual([call for call in model_stubs.CALLS if call[0] == "voice_embed"], [("voice_embed", 3)])
+
+    def test_partial_failures(self):
+        embs = self.embed(self.media("2", "none", "4"))
+
+        self.assertAlmostEqual(embs[0][2], 1.0)
+        self.assertEqual(embs[1], [])
+        self.assertAlmostEqual(embs[2][4], 1.0)
+        self.assertIn(("voice_embed", 2), model_stubs.CALLS)
+
+    def test_empty(self):
+        self.assertEqual(self.embed([]), [])
+        self.assertEqual(model_stubs.CALLS, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class AdmissionRejected(Exception):
+    """
+    Raised when work is refused because the executor is saturated.
+
+    Attributes:
+        retry_after (int): The number of seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+
+        self.retry_after = retry_after
+
+class DeadlineExceeded(AdmissionRejected):
+    """
+    Raised when a request's deadline passes before its work finished.
+    """
+
+class AdmissionController:
+    """
+    Bounds the work queued on a model executor and enforces per-request deadlines.
+
+    Submissions beyond max_queue are rejected straight away instead of waiting
+    behind work that will finish too late. Work whose deadline passes while it
+    is still queued is cancelled, so the executor only runs requests that can
+    still be answered in time.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, max_queue: int, retry_after: int = 1) -> None:
+        """
+        Args:
+            executor (ThreadPoolExecutor): The executor that runs the model calls.
+            max_queue (int): The maximum number of calls queued or running at once.
+            retry_after (int): The Retry-After seconds reported when a call is rejected.
+        """
+
+        self.executor = executor
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+        self.depth = 0
+        self.lock = threading.Lock()
+
+    def _release(self, _) -> None:
+        with self.lock:
+            self.depth -= 1
+
+    def _run_before_deadline(self, fn: Callable[[], T], deadline: Optional[float]) -> T:
+        # Skip work that was queued past its deadline
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("Request deadline passed while queued.", self.retry_after)
+
+        return fn()
+
+    async def run(self, fn: Callable[[], T], deadline: Optional[float] = None) -> T:
+        """
+        Runs a blocking call on the executor if there is room for it.
+
+        Args:
+            fn (Callable): The blocking call, usually a functools.partial.
+            deadline (Optional[float]): The time.monotonic() time by which the result is needed.
+
+        Returns:
+            The result of the call.
+
+        Raises:
+            AdmissionRejected: If the queue is full.
+            DeadlineExceeded: If the deadline passes before the call finished.
+        """
+
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("Request deadline passed.", self.retry_after)
+
+        with self.lock:
+            if self.depth >= self.max_queue:
+                raise AdmissionRejected("Executor queue is full.", self.retry_after)
+
+            self.depth += 1
+
+        future = self.executor.submit(self._run_before_deadline, fn, deadline)
+
+        # The slot is freed when the call finishes or is cancelled, not when the caller stops waiting
+        future.add_done_callback(self._release)
+
+        timeout = None if deadline is None else deadline - time.monotonic()
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # Cancelling only succeeds if the call has not started yet
+            future.cancel()
+
+            raise DeadlineExceeded("Request deadline passed while running.", self.retry_after)
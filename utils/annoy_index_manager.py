@@ -1,31 +1,93 @@
 from __future__ import annotations
 
 from ast import Tuple
+import json
 import os
 import ipdb
 
-from annoy import AnnoyIndex
+import numpy as np
 
-from typing import List, Tuple
+from .index_backends import IndexBackend, create_backend
+from .template_store import TemplateStore
+
+from typing import Dict, List, Optional, Tuple
 
 NUM_TREES = 10
+MAX_TEMPLATES = 5
+INDEX_BACKEND = "annoy"
+
+def index_files(index_path: str) -> List[str]:
+    """
+    Gets every file an AnnoyIndexManager writes for an index path.
+    """
+
+    root = os.path.splitext(index_path)[0]
+
+    return [index_path, root + ".backend.json", *TemplateStore.files(root + ".templates.npy")]
+
+def read_backend(index_path: str) -> Optional[Tuple[str, dict]]:
+    """
+    Reads the backend an index file was saved with.
+
+    Returns:
+        Optional[Tuple[str, dict]]: The backend name and options, or None if nothing was recorded, as for indexes saved by Annoy before the backend was pluggable.
+    """
+
+    path = index_files(index_path)[1]
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        recorded = json.load(f)
+
+    return recorded["backend"], recorded["options"]
 
 class AnnoyIndexManager:
-    def __init__(self, index_path: str, vector_length: int, num_trees: int = NUM_TREES):
+    def __init__(self,
+                 index_path: str,
+                 vector_length: int,
+                 num_trees: int = NUM_TREES,
+                 max_templates: int = MAX_TEMPLATES,
+                 backend: str = INDEX_BACKEND,
+                 template_dtype: str = "float32",
+                 **backend_options):
         """
         Initializes the AnnoyIndexManager.
 
+        The index holds one centroid per user for the first-stage search. The
+        enrollment templates each centroid is computed from are kept next to the
+        index file and are used to re-score candidates. They are memory-mapped,
+        so re-scoring reads the full-precision rows of the candidates only.
+
+        The search engine is pluggable: "exact" scans a NumPy matrix and suits
+        small galleries, "annoy" builds random projection trees and "hnsw"
+        keeps an hnswlib graph that accepts inserts without a rebuild.
+        "quantized" scans compressed vectors (float16, int8 or product
+        quantized) to shrink memory and load time; its approximate ranking is
+        corrected when candidates are re-scored against the templates.
+
         Args:
             index_path (str): The path to the index file.
             vector_length (int): The length of the vectors to be indexed.
-            num_trees (int): The number of trees to build in the index.
+            num_trees (int): The number of trees to build in the index. Only used by the annoy backend.
+            max_templates (int): The maximum number of templates kept per user.
+            backend (str): The search engine, one of "exact", "quantized", "annoy" or "hnsw".
+            template_dtype (str): The precision templates are stored in, "float32" or "float16".
+            **backend_options: Engine specific options, such as codec for quantized, search_k for annoy or ef for hnsw.
         """
 
         self.index_path = index_path
+        _, self.backend_path, self.templates_path, *_ = index_files(index_path)
         self.vector_length = vector_length
         self.num_trees = num_trees
+        self.max_templates = max_templates
+        self.backend = backend
+        self.backend_options = backend_options
+        self.template_dtype = np.dtype(template_dtype)
 
-        self.index = AnnoyIndex(self.vector_length, "angular")
+        self.index = self._new_backend()
+        self.templates = TemplateStore(self.templates_path, vector_length, template_dtype)
 
         self.load_index()
     
@@ -39,10 +101,15 @@ class AnnoyIndexManager:
         """
 
         try:
-            new_index = self.__copy__(all_ids)
-            new_index.add_item(id, vector)
+            if self.index.incremental:
+                self.index.add_item(id, vector)
+            else:
+                new_index = self.__copy__(all_ids)
+                new_index.add_item(id, vector)
 
-            self.rebuild_index(new_index)
+                self.rebuild_index(new_index)
+
+            self.templates[id] = np.asarray([vector], dtype=self.template_dtype)
             self.save_index()
 
             return True
@@ -50,6 +117,38 @@ class AnnoyIndexManager:
             print(f"Error adding vector to index: {e}")
             return False
 
+    def add_template(self, id: int, vector: List[float], all_ids: List[int]) -> bool:
+        """
+        Adds another template for an existing user and moves their centroid.
+
+        Only the most recent max_templates templates are kept.
+
+        Args:
+            id (int): The ID of the user.
+            vector (List[float]): The template to add.
+            all_ids (List[int]): The IDs of all users currently in the index.
+        """
+
+        try:
+            templates = np.vstack([self.get_templates(id), np.asarray([vector], dtype=self.template_dtype)])
+            templates = templates[-self.max_templates:]
+
+            if self.index.incremental:
+                self.index.add_item(id, self._centroid(templates))
+            else:
+                new_index = self.__copy__(all_ids, exclude=[id])
+                new_index.add_item(id, self._centroid(templates))
+
+                self.rebuild_index(new_index)
+
+            self.templates[id] = templates
+            self.save_index()
+
+            return True
+        except Exception as e:
+            print(f"Error adding template to index: {e}")
+            return False
+
     def delete(self, id: int, all_ids: List[int]) -> bool:
         """
         Deletes a vector from the index.
@@ -62,6 +161,7 @@ class AnnoyIndexManager:
             new_index = self.__copy__(all_ids, exclude=[id])
 
             self.rebuild_index(new_index)
+            self.templates.pop(id, None)
             self.save_index()
 
             return True
@@ -69,6 +169,84 @@ class AnnoyIndexManager:
             print(f"Error deleting vector from index: {e}")
             return False
 
+    def rebuild(self, all_ids: List[int]) -> bool:
+        """
+        Rebuilds the index from scratch with the current num_trees.
+
+        Templates of IDs that are not in all_ids are dropped, which also
+        compacts away anything left behind by earlier deletes. Users indexed
+        before templates were stored keep their vector as their only template.
+        Learned parameters, such as pq codebooks, are retrained on the whole
+        gallery. Every other write encodes with the frozen ones.
+
+        Args:
+            all_ids (List[int]): The IDs of all users that should be in the index.
+
+        Returns:
+            bool: False if the rebuild failed or some of all_ids were not in the index.
+        """
+
+        try:
+            templates = {i: self.get_templates(i) for i in all_ids}
+            missing = [i for i, t in templates.items() if len(t) == 0]
+
+            for i in set(self.templates) - set(all_ids):
+                del self.templates[i]
+
+            # Users indexed before templates were stored keep their vector
+            for i, t in templates.items():
+                if len(t) > 0 and i not in self.templates:
+                    self.templates[i] = t
+
+            new_index = self.__copy__(list(self.templates))
+            new_index.train()
+
+            self.rebuild_index(new_index)
+            self.save_index()
+        except Exception as e:
+            print(f"Error rebuilding index: {e}")
+            return False
+
+        if missing:
+            print(f"Error rebuilding index: {len(missing)} users are not in the index: {missing}")
+            return False
+
+        return True
+
+    def set_templates(self, id: int, templates: List[List[float]]) -> None:
+        """
+        Replaces all templates of a user without touching the index.
+
+        Call rebuild afterwards to move the centroids, e.g. after re-embedding
+        every user with a new model.
+
+        Args:
+            id (int): The ID of the user.
+            templates (List[List[float]]): The new templates, at most max_templates are kept.
+        """
+
+        self.templates[id] = np.asarray(templates, dtype=self.template_dtype)[-self.max_templates:]
+
+    def get_all_ids(self) -> List[int]:
+        """
+        Gets the IDs of all users with stored templates.
+
+        Returns:
+            List[int]: The IDs, in ascending order.
+        """
+
+        return sorted(self.templates)
+
+    def get_index_ids(self) -> List[int]:
+        """
+        Gets the IDs of all users in the index itself, with or without stored templates.
+
+        Returns:
+            List[int]: The IDs, in ascending order.
+        """
+
+        return sorted(self.index.get_item_ids())
+
     def get_ids(self, vector: List[float], num_results: int = 1) -> Tuple[List[int], List[float]]:
         """
         Gets the IDs of the nearest vectors to the given vector.
@@ -85,6 +263,21 @@ class AnnoyIndexManager:
 
         return ids, dists
 
+    def get_ids_batch(self, vectors: List[List[float]], num_results: int = 1) -> Tuple[List[List[int]], List[List[float]]]:
+        """
+        Gets the IDs of the nearest vectors to each of the given vectors.
+
+        Args:
+            vectors (List[List[float]]): The vectors to search for.
+            num_results (int): The number of results to return per vector.
+
+        Returns:
+            List[List[int]]: The IDs of the nearest vectors, one list per query vector.
+            List[List[float]]: The distances to the nearest vectors, one list per query vector.
+        """
+
+        return self.index.get_nns_by_vectors(vectors, num_results)
+
     def get_vectors(self, ids: int) -> List[float]:
         """
         Gets the vectors corresponding to the given IDs.
@@ -102,23 +295,122 @@ class AnnoyIndexManager:
             return []
 
         return vectors
-    
+
+    def get_templates(self, id: int) -> np.ndarray:
+        """
+        Gets all templates of a user.
+
+        Users enrolled before templates were stored fall back to their single
+        indexed vector. Annoy returns zeros for IDs with no item, which are
+        treated as missing.
+
+        Args:
+            id (int): The ID of the user.
+
+        Returns:
+            np.ndarray: The templates, with shape (num_templates, vector_length).
+        """
+
+        if id in self.templates:
+            return self.templates[id]
+
+        vector = self.get_vectors(id)
+
+        if not any(vector):
+            return np.empty((0, self.vector_length), dtype=self.template_dtype)
+
+        return np.asarray([vector], dtype=self.template_dtype)
+
+    def rescore(self, vector: List[float], ids: List[int]) -> Tuple[List[int], List[float]]:
+        """
+        Re-scores candidate users against all of their templates.
+
+        Each candidate is scored by the cosine similarity of its closest
+        template, computed for every template of every candidate at once.
+
+        Args:
+            vector (List[float]): The query vector.
+            ids (List[int]): The candidate IDs, usually from get_ids.
+
+        Returns:
+            List[int]: The candidate IDs, best match first.
+            List[float]: The cosine similarity of each candidate's best template.
+        """
+
+        stacks = [self.get_templates(i) for i in ids]
+        counts = [len(stack) for stack in stacks]
+
+        if not ids or sum(counts) == 0:
+            return [], []
+
+        matrix = self._normalize(np.vstack(stacks))
+        query = self._normalize(np.asarray(vector, dtype=np.float32))
+
+        sims = matrix @ query
+        owners = np.repeat(np.arange(len(ids)), counts)
+
+        best = np.full(len(ids), -np.inf, dtype=np.float32)
+        np.maximum.at(best, owners, sims)
+
+        order = [i for i in np.argsort(-best) if counts[i] > 0]
+
+        return [ids[i] for i in order], [float(best[i]) for i in order]
+
     def load_index(self) -> None:
         """
-        Loads the index from the index file.
+        Loads the index and the templates from their files.
+
+        The backend each index was saved with is recorded next to it. An index
+        saved by another backend, or with another codec, is read with that
+        backend and converted in memory, keeping users that have no templates.
+        Unrecorded files that cannot be read are rebuilt in memory from the
+        templates. Loading never writes: the files are only replaced by the
+        next write. Without templates to rebuild from, the error is raised
+        instead of starting with an empty index.
         """
 
-        if os.path.exists(self.index_path):
+        self.templates.load()
+
+        if not os.path.exists(self.index_path):
+            return
+
+        recorded = read_backend(self.index_path)
+
+        if recorded is not None and not self._same_backend(*recorded):
+            source = create_backend(recorded[0], self.vector_length, **recorded[1])
+            source.load(self.index_path)
+
+            self.rebuild_index(self._convert(source))
+            return
+
+        try:
             self.index.load(self.index_path)
+        except Exception as e:
+            if recorded is not None or not self.templates:
+                raise
+
+            print(f"Error loading index, rebuilding from templates: {e}")
+
+            new_index = self._new_backend()
+
+            for id, templates in self.templates.items():
+                new_index.add_item(id, self._centroid(templates))
+
+            self.rebuild_index(new_index)
     
     def save_index(self) -> None:
         """
-        Saves the index to the index file.
+        Saves the index and the templates to their files.
         """
 
         self.index.save(self.index_path)
 
-    def rebuild_index(self, new_index : AnnoyIndex) -> None:
+        with open(self.backend_path, "w") as f:
+            json.dump({"backend": self.backend, "options": self.backend_options}, f)
+
+        self.templates.save()
+
+    def rebuild_index(self, new_index : IndexBackend) -> None:
         """
         Rebuilds the index from scratch.
         """
@@ -130,21 +422,78 @@ class AnnoyIndexManager:
         """
         Creates a copy of the AnnoyIndexManager.
 
+        Centroids are recomputed from the full-precision templates where
+        available, so lossy backends do not degrade with every rebuild. The
+        copy reuses the learned parameters of the current index.
+
         Returns:
             AnnoyIndexManager: The copy of the AnnoyIndexManager.
         """
 
-        new_index = AnnoyIndex(self.vector_length, "angular")
+        new_index = self._new_backend()
+        new_index.share_training(self.index)
 
         for i in all_ids:
             if i in exclude:
                 continue
 
-            emb = self.index.get_item_vector(i)
+            if i in self.templates:
+                emb = self._centroid(self.templates[i])
+            else:
+                emb = self.index.get_item_vector(i)
+
             new_index.add_item(i, emb)
 
         return new_index
     
+    def _convert(self, source: IndexBackend) -> IndexBackend:
+        """
+        Moves every user of an index saved by another backend into a new index with the configured one.
+        """
+
+        new_index = self._new_backend()
+
+        for i in sorted(set(source.get_item_ids()) | set(self.templates)):
+            if i in self.templates:
+                new_index.add_item(i, self._centroid(self.templates[i]))
+            else:
+                new_index.add_item(i, source.get_item_vector(i))
+
+        return new_index
+
+    def _same_backend(self, backend: str, options: dict) -> bool:
+        """
+        Checks whether an index saved with the given backend can be loaded by the configured one.
+        """
+
+        return backend == self.backend and options.get("codec") == self.backend_options.get("codec")
+
+    def _new_backend(self) -> IndexBackend:
+        """
+        Creates an empty index with the configured backend.
+        """
+
+        return create_backend(self.backend, self.vector_length, **self.backend_options)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        Scales vectors to unit length along their last axis.
+        """
+
+        vectors = vectors.astype(np.float32, copy=False)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+        return vectors / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def _centroid(cls, templates: np.ndarray) -> List[float]:
+        """
+        Computes the angular centroid of a user's templates.
+        """
+
+        return cls._normalize(templates).mean(axis=0).tolist()
+
     def __sizeof__(self) -> int:
         """
         Returns the size of the index.
@@ -8,11 +8,15 @@ class Error(Enum):
         USER_NOT_FOUND (tuple): The error code and message for user not found.
         INTERNAL_SERVER_ERROR (tuple): The error code and message for internal server error.
         UNAUTHORIZED (tuple): The error code and message for unauthorized access.
+        BAD_REQUEST (tuple): The error code and message for a malformed request.
+        SERVICE_UNAVAILABLE (tuple): The error code and message for a saturated server.
     """
 
     USER_NOT_FOUND = ("user_not_found", "User not found.", 404)
     INTERNAL_SERVER_ERROR = ("internal_server_error", "Internal server error. Please try again later.", 500)
     UNAUTHORIZED = ("unauthorized", "Unauthorized", 401)
+    BAD_REQUEST = ("bad_request", "Bad request.", 400)
+    SERVICE_UNAVAILABLE = ("service_unavailable", "Server is busy. Please try again later.", 503)
 
     def __init__(self, code: str, message: str, http_status: int) -> None:
         self._code = code
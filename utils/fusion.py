@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+
+import numpy as np
+
+from typing import List, Optional
+
+def calibrate(similarity: float, threshold: float, scale: float) -> float:
+    """
+    Maps a raw cosine similarity to a match probability with a logistic curve.
+
+    Args:
+        similarity (float): The cosine similarity.
+        threshold (float): The similarity at which the probability is 0.5.
+        scale (float): The steepness of the curve around the threshold.
+
+    Returns:
+        float: The calibrated score, between 0 and 1.
+    """
+
+    return 1 / (1 + math.exp(-scale * (similarity - threshold)))
+
+class ScoreFusion:
+    """
+    Combines calibrated face and voice scores into a single decision with a weighted sum.
+
+    Attributes:
+        face_weight (float): The weight of the face score.
+        voice_weight (float): The weight of the voice score.
+        accept_threshold (float): The fused score at or above which access is granted.
+        match_threshold (float): The single modality score at or above which that modality counts as a match.
+        modality_floor (Optional[float]): The score each modality must reach for the fused score to grant access, or None to rely on the fused score alone.
+        decisive_accept (Optional[float]): A single modality score at or above which the other modality is skipped, or None to always use both.
+        decisive_reject (Optional[float]): A single modality score at or below which the other modality cannot change a rejection.
+    """
+
+    def __init__(self,
+                 face_weight: float = 0.5,
+                 voice_weight: float = 0.5,
+                 accept_threshold: float = 0.5,
+                 match_threshold: float = 0.5,
+                 modality_floor: Optional[float] = 0.25,
+                 decisive_accept: Optional[float] = 0.99,
+                 decisive_reject: Optional[float] = 0.01) -> None:
+        self.face_weight = face_weight
+        self.voice_weight = voice_weight
+        self.accept_threshold = accept_threshold
+        self.match_threshold = match_threshold
+        self.modality_floor = modality_floor
+        self.decisive_accept = decisive_accept
+        self.decisive_reject = decisive_reject
+
+    def fuse(self, face_score: float, voice_score: float) -> float:
+        """
+        Fuses the two calibrated scores.
+
+        Args:
+            face_score (float): The calibrated face score.
+            voice_score (float): The calibrated voice score.
+
+        Returns:
+            float: The fused score, between 0 and 1.
+        """
+
+        return (self.face_weight * face_score + self.voice_weight * voice_score) / (self.face_weight + self.voice_weight)
+
+    def accept(self, face_score: float, voice_score: float) -> bool:
+        """
+        Decides whether the fused score grants access.
+
+        A strong modality can carry a borderline one, but not one that clearly
+        belongs to someone else: both scores must reach the modality floor.
+
+        Args:
+            face_score (float): The calibrated face score.
+            voice_score (float): The calibrated voice score.
+
+        Returns:
+            bool: True if access is granted, False otherwise.
+        """
+
+        if self.modality_floor is not None and min(face_score, voice_score) < self.modality_floor:
+            return False
+
+        return self.fuse(face_score, voice_score) >= self.accept_threshold
+
+    def is_match(self, score: float) -> bool:
+        """
+        Checks whether one modality matches on its own.
+
+        Args:
+            score (float): The calibrated score of one modality.
+
+        Returns:
+            bool: True if the modality matches, False otherwise.
+        """
+
+        return score >= self.match_threshold
+
+    def is_decisive(self, score: float) -> Optional[bool]:
+        """
+        Checks whether one modality's score settles the decision on its own.
+
+        Args:
+            score (float): The calibrated score of one modality.
+
+        Returns:
+            Optional[bool]: True for a decisive accept, False for a decisive reject, None if the other modality is needed.
+        """
+
+        if self.decisive_accept is not None and score >= self.decisive_accept:
+            return True
+
+        if self.decisive_reject is not None and score <= self.decisive_reject:
+            return False
+
+        return None
+
+class LogisticFusion(ScoreFusion):
+    """
+    Fuses the scores with a trained logistic regression on their log-odds.
+
+    Attributes:
+        weights (List[float]): The face and voice weights.
+        bias (float): The intercept.
+    """
+
+    def __init__(self, weights: List[float], bias: float, **kwargs) -> None:
+        super().__init__(face_weight=weights[0], voice_weight=weights[1], **kwargs)
+
+        self.weights = weights
+        self.bias = bias
+
+    def fuse(self, face_score: float, voice_score: float) -> float:
+        features = _logit(np.array([face_score, voice_score]))
+        z = float(features @ np.asarray(self.weights) + self.bias)
+
+        return 1 / (1 + math.exp(-z))
+
+    @classmethod
+    def fit(cls,
+            face_scores: List[float],
+            voice_scores: List[float],
+            labels: List[int],
+            epochs: int = 2000,
+            learning_rate: float = 0.1,
+            **kwargs) -> LogisticFusion:
+        """
+        Trains the fusion on labelled genuine (1) and impostor (0) attempts with gradient descent.
+
+        Args:
+            face_scores (List[float]): The calibrated face score of each attempt.
+            voice_scores (List[float]): The calibrated voice score of each attempt.
+            labels (List[int]): 1 for genuine attempts, 0 for impostors.
+            epochs (int): The number of gradient descent steps.
+            learning_rate (float): The step size.
+            **kwargs: Decision thresholds passed on to ScoreFusion.
+
+        Returns:
+            LogisticFusion: The trained fusion.
+        """
+
+        features = _logit(np.column_stack([face_scores, voice_scores]))
+        labels = np.asarray(labels, dtype=np.float64)
+
+        weights = np.zeros(2)
+        bias = 0.0
+
+        for _ in range(epochs):
+            preds = 1 / (1 + np.exp(-(features @ weights + bias)))
+            error = preds - labels
+
+            weights -= learning_rate * features.T @ error / len(labels)
+            bias -= learning_rate * error.mean()
+
+        return cls(weights.tolist(), float(bias), **kwargs)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the trained parameters to a JSON file.
+        """
+
+        with open(path, "w") as f:
+            json.dump({"weights": self.weights, "bias": self.bias}, f)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Optional[LogisticFusion]:
+        """
+        Loads trained parameters from a JSON file.
+
+        Returns:
+            LogisticFusion: The trained fusion, or None if the file does not exist.
+        """
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            params = json.load(f)
+
+        return cls(params["weights"], params["bias"], **kwargs)
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+
+    return np.log(p / (1 - p))
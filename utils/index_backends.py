@@ -0,0 +1,550 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+from annoy import AnnoyIndex
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+from .quantization import Float16Codec, create_codec
+
+from typing import List, Tuple
+
+class IndexBackend(ABC):
+    """
+    Interface for the nearest-neighbour engines behind AnnoyIndexManager.
+
+    The methods mirror the AnnoyIndex API so the manager can treat every engine
+    the same way. Distances are angular distances, sqrt(2 - 2 * cos), as
+    returned by Annoy.
+
+    Attributes:
+        incremental (bool): Whether items can be added after build() without rebuilding.
+    """
+
+    incremental = False
+
+    def __init__(self, vector_length: int) -> None:
+        self.vector_length = vector_length
+
+    @abstractmethod
+    def add_item(self, id: int, vector: List[float]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def build(self, num_trees: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_nns_by_vector(self, vector: List[float], n: int, include_distances: bool = False):
+        raise NotImplementedError
+
+    def get_nns_by_vectors(self, vectors: List[List[float]], n: int) -> Tuple[List[List[int]], List[List[float]]]:
+        """
+        Searches for several vectors. Engines without a batched search loop over get_nns_by_vector.
+
+        Args:
+            vectors (List[List[float]]): The vectors to search for.
+            n (int): The number of results per vector.
+
+        Returns:
+            List[List[int]]: The IDs of the nearest items, one list per query vector.
+            List[List[float]]: The distances to the nearest items, one list per query vector.
+        """
+
+        all_ids = []
+        all_dists = []
+
+        for vector in vectors:
+            ids, dists = self.get_nns_by_vector(vector, n, include_distances=True)
+
+            all_ids.append(ids)
+            all_dists.append(dists)
+
+        return all_ids, all_dists
+
+    @abstractmethod
+    def get_item_vector(self, id: int) -> List[float]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_n_items(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_item_ids(self) -> List[int]:
+        """
+        Returns the IDs of all items in the index.
+        """
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, path: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def load(self, path: str) -> None:
+        raise NotImplementedError
+
+    def train(self) -> None:
+        """
+        Fits learned parameters, such as pq codebooks, to the items in the index. Engines without any do nothing.
+        """
+
+        pass
+
+    def share_training(self, other: IndexBackend) -> None:
+        """
+        Reuses the learned parameters of another index, so a copy of it does not need training.
+        """
+
+        pass
+
+class ScanBackend(IndexBackend):
+    """
+    Base for the engines that scan every item: buffers the inserts and selects the top results.
+
+    Subclasses move the buffered inserts into their arrays in _flush and score
+    normalized queries against every item in _scores.
+    """
+
+    incremental = True
+
+    def __init__(self, vector_length: int) -> None:
+        super().__init__(vector_length)
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.positions = {}
+        self.pending = {}
+
+    def add_item(self, id: int, vector: List[float]) -> None:
+        # Inserts are buffered so that filling the index costs one copy instead of one per item
+        self.pending[id] = vector
+
+    def build(self, num_trees: int) -> None:
+        self._flush()
+
+    @abstractmethod
+    def _flush(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Returns the cosine similarity of each unit query to every item, with shape (queries, items).
+        """
+
+        raise NotImplementedError
+
+    def get_nns_by_vector(self, vector: List[float], n: int, include_distances: bool = False):
+        ids, dists = self.get_nns_by_vectors([vector], n)
+
+        if include_distances:
+            return ids[0], dists[0]
+
+        return ids[0]
+
+    def get_nns_by_vectors(self, vectors: List[List[float]], n: int) -> Tuple[List[List[int]], List[List[float]]]:
+        self._flush()
+
+        if len(self.ids) == 0 or len(vectors) == 0:
+            return [[] for _ in vectors], [[] for _ in vectors]
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        sims = self._scores(queries)
+        n = min(n, len(self.ids))
+
+        top = np.argpartition(-sims, n - 1, axis=1)[:, :n]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+        dists = np.sqrt(np.maximum(2 - 2 * top_sims, 0))
+
+        return self.ids[top].tolist(), dists.tolist()
+
+    def get_n_items(self) -> int:
+        self._flush()
+
+        return len(self.ids)
+
+    def get_item_ids(self) -> List[int]:
+        self._flush()
+
+        return self.ids.tolist()
+
+class ExactBackend(ScanBackend):
+    """
+    Exact search with a NumPy matrix scan. Faster than Annoy for small galleries and always correct.
+    """
+
+    def __init__(self, vector_length: int) -> None:
+        super().__init__(vector_length)
+
+        self.vectors = np.empty((0, vector_length), dtype=np.float32)
+        self.unit_vectors = self.vectors
+
+    def _flush(self) -> None:
+        """
+        Moves the buffered inserts into the matrix.
+        """
+
+        if not self.pending:
+            return
+
+        new_ids = []
+        new_vectors = []
+
+        for id, vector in self.pending.items():
+            if id in self.positions:
+                self.vectors[self.positions[id]] = vector
+            else:
+                self.positions[id] = len(self.ids) + len(new_ids)
+                new_ids.append(id)
+                new_vectors.append(vector)
+
+        if new_ids:
+            self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64)])
+            self.vectors = np.vstack([self.vectors, np.asarray(new_vectors, dtype=np.float32)])
+
+        self.pending = {}
+
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.unit_vectors = self.vectors / np.maximum(norms, 1e-12)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        return queries @ self.unit_vectors.T
+
+    def get_item_vector(self, id: int) -> List[float]:
+        self._flush()
+
+        return self.vectors[self.positions[id]].tolist()
+
+    def save(self, path: str) -> None:
+        self._flush()
+
+        with open(path, "wb") as f:
+            np.savez(f, ids=self.ids, vectors=self.vectors)
+
+    def load(self, path: str) -> None:
+        data = np.load(path)
+
+        self.ids = data["ids"]
+        self.vectors = data["vectors"]
+        self.positions = {int(id): i for i, id in enumerate(self.ids)}
+
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.unit_vectors = self.vectors / np.maximum(norms, 1e-12)
+
+class QuantizedBackend(ScanBackend):
+    """
+    Exact scan over compressed vectors, for a first-stage search that is re-ranked at full precision.
+
+    Only the codes are held in memory and saved, so RAM and load time drop
+    by 2x (float16), 4x (int8) or more (pq) compared to ExactBackend. Scores
+    are approximate, so callers should fetch a few more candidates than they
+    need and re-score them against the full-precision templates.
+
+    Codecs that are trained on the gallery, such as pq, are fitted by train
+    and frozen in between: new items are encoded with the existing codebooks.
+    Until the first train, items are held as float16.
+    """
+
+    def __init__(self, vector_length: int, codec: str = "int8", **codec_options) -> None:
+        """
+        Args:
+            vector_length (int): The length of the vectors to be indexed.
+            codec (str): The compression, one of "float16", "int8" or "pq".
+            **codec_options: Codec specific options, such as num_subspaces for pq.
+        """
+
+        super().__init__(vector_length)
+
+        self.codec = create_codec(codec, vector_length, **codec_options)
+        self.codec_options = codec_options
+        self.untrained_codec = Float16Codec(vector_length)
+        self.codes = None
+
+    def _encoder(self):
+        """
+        Returns the codec the codes are in: the configured one once it is trained.
+        """
+
+        return self.codec if self.codec.is_trained() else self.untrained_codec
+
+    def _flush(self) -> None:
+        """
+        Encodes the buffered inserts and moves them into the code arrays.
+        """
+
+        if not self.pending:
+            return
+
+        ids = list(self.pending)
+        vectors = np.asarray([self.pending[id] for id in ids], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        codes = self._encoder().encode(vectors)
+        self.pending = {}
+
+        new_rows = []
+
+        for row, id in enumerate(ids):
+            if id in self.positions:
+                for key in codes:
+                    self.codes[key][self.positions[id]] = codes[key][row]
+            else:
+                self.positions[id] = len(self.ids) + len(new_rows)
+                new_rows.append(row)
+
+        if new_rows:
+            new_codes = {key: value[new_rows] for key, value in codes.items()}
+
+            if self.codes is None:
+                self.codes = new_codes
+            else:
+                self.codes = {key: np.concatenate([self.codes[key], new_codes[key]]) for key in self.codes}
+
+            self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)[new_rows]])
+
+    def train(self) -> None:
+        """
+        Fits the codec to every item and re-encodes them.
+
+        Buffered inserts are used at full precision, items already encoded are decoded first.
+        """
+
+        if not self.codec.needs_training:
+            return
+
+        vectors = dict(zip(self.ids.tolist(), self._encoder().decode(self.codes))) if self.codes is not None else {}
+        vectors.update(self.pending)
+
+        if not vectors:
+            return
+
+        ids = list(vectors)
+        matrix = np.asarray([vectors[id] for id in ids], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        # A new codec, since the current one may be shared with the index this one was copied from
+        codec = create_codec(self.codec.name, self.vector_length, **self.codec_options)
+        codec.fit(matrix)
+
+        self.codec = codec
+        self.ids = np.empty(0, dtype=np.int64)
+        self.codes = None
+        self.positions = {}
+        self.pending = dict(zip(ids, matrix))
+
+        self._flush()
+
+    def share_training(self, other: IndexBackend) -> None:
+        if isinstance(other, QuantizedBackend) and other.codec.name == self.codec.name and other.codec.is_trained():
+            self.codec = other.codec
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        return self._encoder().scores(self.codes, queries)
+
+    def get_item_vector(self, id: int) -> List[float]:
+        self._flush()
+
+        row = self.positions[id]
+
+        return self._encoder().decode({key: value[row:row + 1] for key, value in self.codes.items()})[0].tolist()
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory held by the codes.
+        """
+
+        self._flush()
+
+        if self.codes is None:
+            return 0
+
+        return sum(value.nbytes for value in self.codes.values())
+
+    def save(self, path: str) -> None:
+        self._flush()
+
+        encoder = self._encoder()
+        codes = {f"code_{key}": value for key, value in (self.codes or {}).items()}
+        state = {f"state_{key}": value for key, value in encoder.state().items() if value is not None}
+
+        with open(path, "wb") as f:
+            np.savez(f, ids=self.ids, codec=np.array(encoder.name), **codes, **state)
+
+    def load(self, path: str) -> None:
+        data = np.load(path)
+        saved = str(data["codec"])
+
+        # An untrained codec saves its items with the stand-in codec
+        if saved != self.codec.name and not (self.codec.needs_training and saved == self.untrained_codec.name):
+            raise ValueError(f"Index was saved with the {saved} codec, not {self.codec.name}.")
+
+        self.ids = data["ids"]
+        self.codes = {key[len("code_"):]: data[key] for key in data.files if key.startswith("code_")} or None
+        self.positions = {int(id): i for i, id in enumerate(self.ids)}
+
+        if saved == self.codec.name:
+            self.codec.load_state({key[len("state_"):]: data[key] for key in data.files if key.startswith("state_")})
+
+class AnnoyBackend(IndexBackend):
+    """
+    Approximate search with Annoy's random projection trees.
+    """
+
+    def __init__(self, vector_length: int, search_k: int = -1) -> None:
+        """
+        Args:
+            vector_length (int): The length of the vectors to be indexed.
+            search_k (int): The number of nodes inspected per query, -1 for Annoy's default of n * num_trees.
+        """
+
+        super().__init__(vector_length)
+
+        self.search_k = search_k
+        self.index = AnnoyIndex(vector_length, "angular")
+
+    def add_item(self, id: int, vector: List[float]) -> None:
+        self.index.add_item(id, vector)
+
+    def build(self, num_trees: int) -> None:
+        self.index.build(num_trees)
+
+    def get_nns_by_vector(self, vector: List[float], n: int, include_distances: bool = False):
+        return self.index.get_nns_by_vector(vector, n, search_k=self.search_k, include_distances=include_distances)
+
+    def get_item_vector(self, id: int) -> List[float]:
+        return self.index.get_item_vector(id)
+
+    def get_n_items(self) -> int:
+        return self.index.get_n_items()
+
+    def get_item_ids(self) -> List[int]:
+        # Annoy allocates every id below the largest one and returns zeros for the gaps
+        return [id for id in range(self.index.get_n_items()) if any(self.index.get_item_vector(id))]
+
+    def save(self, path: str) -> None:
+        self.index.save(path)
+
+    def load(self, path: str) -> None:
+        self.index.load(path)
+
+class HNSWBackend(IndexBackend):
+    """
+    Approximate search with an hnswlib graph, which supports true incremental inserts.
+
+    hnswlib stores vectors normalized in cosine space, so get_item_vector returns unit vectors.
+    """
+
+    incremental = True
+
+    def __init__(self, vector_length: int, M: int = 16, ef_construction: int = 200, ef: int = 64, max_elements: int = 1024) -> None:
+        """
+        Args:
+            vector_length (int): The length of the vectors to be indexed.
+            M (int): The number of graph links per element.
+            ef_construction (int): The size of the candidate list while inserting.
+            ef (int): The size of the candidate list while searching.
+            max_elements (int): The initial capacity, doubled whenever it is reached.
+        """
+
+        if hnswlib is None:
+            raise ImportError("The hnsw index backend requires hnswlib, install it with `pip install hnswlib`.")
+
+        super().__init__(vector_length)
+
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+
+        self.index = hnswlib.Index(space="cosine", dim=vector_length)
+        self.index.init_index(max_elements=max_elements, ef_construction=ef_construction, M=M)
+        self.index.set_ef(ef)
+
+    def add_item(self, id: int, vector: List[float]) -> None:
+        if self.index.get_current_count() >= self.index.get_max_elements():
+            self.index.resize_index(2 * self.index.get_max_elements())
+
+        self.index.add_items(np.asarray([vector], dtype=np.float32), [id])
+
+    def build(self, num_trees: int) -> None:
+        # The graph is built while inserting
+        pass
+
+    def get_nns_by_vector(self, vector: List[float], n: int, include_distances: bool = False):
+        ids, dists = self.get_nns_by_vectors([vector], n)
+
+        if include_distances:
+            return ids[0], dists[0]
+
+        return ids[0]
+
+    def get_nns_by_vectors(self, vectors: List[List[float]], n: int) -> Tuple[List[List[int]], List[List[float]]]:
+        n = min(n, self.index.get_current_count())
+
+        if n == 0 or len(vectors) == 0:
+            return [[] for _ in vectors], [[] for _ in vectors]
+
+        self.index.set_ef(max(self.ef, n))
+        labels, dists = self.index.knn_query(np.asarray(vectors, dtype=np.float32), k=n)
+
+        # Cosine distance to angular distance
+        dists = np.sqrt(np.maximum(2 * dists, 0))
+
+        return labels.astype(np.int64).tolist(), dists.tolist()
+
+    def get_item_vector(self, id: int) -> List[float]:
+        return self.index.get_items([id])[0].tolist()
+
+    def get_n_items(self) -> int:
+        return self.index.get_current_count()
+
+    def get_item_ids(self) -> List[int]:
+        return [int(id) for id in self.index.get_ids_list()]
+
+    def save(self, path: str) -> None:
+        self.index.save_index(path)
+
+    def load(self, path: str) -> None:
+        # Loading into an initialized graph frees it first and leaves it unusable when the file is not an hnswlib index
+        index = hnswlib.Index(space="cosine", dim=self.vector_length)
+        index.load_index(path)
+        index.set_ef(self.ef)
+
+        self.index = index
+
+BACKENDS = {
+    "exact": ExactBackend,
+    "quantized": QuantizedBackend,
+    "annoy": AnnoyBackend,
+    "hnsw": HNSWBackend,
+}
+
+def create_backend(name: str, vector_length: int, **options) -> IndexBackend:
+    """
+    Creates an index backend by name.
+
+    Args:
+        name (str): One of "exact", "quantized", "annoy" or "hnsw".
+        vector_length (int): The length of the vectors to be indexed.
+        **options: Engine specific options, such as codec for quantized, search_k for Annoy or ef for HNSW.
+
+    Returns:
+        IndexBackend: The new, empty backend.
+    """
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown index backend: {name}. Choose one of {', '.join(BACKENDS)}.")
+
+    return BACKENDS[name](vector_length, **options)
@@ -0,0 +1,435 @@
+"""
+Offline maintenance of the face and voice indexes.
+
+Stop the API server first, then run one of:
+
+    python -m utils.index_maintenance rebuild --num-trees 50
+    python -m utils.index_maintenance verify
+    python -m utils.index_maintenance recall --queries 1000 --k 5
+    python -m utils.index_maintenance reembed --media-dir enrollments
+
+rebuild compacts the indexes: every index is rebuilt from the stored
+templates of the users in the database, optionally with another tree count,
+backend or number of shards. verify compares the indexed ids with the
+database rows. recall measures how often the configured search finds the
+same nearest centroids as an exact scan. reembed recomputes every template
+from the original media, e.g. after a model upgrade.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import create_engine, Session
+
+from models.user import User
+from .annoy_index_manager import AnnoyIndexManager, INDEX_BACKEND, NUM_TREES, index_files, read_backend
+from .index_backends import ExactBackend
+from .sharded_index_manager import ShardedIndexManager
+
+from typing import Dict, List, Optional, Tuple
+
+DATABASE_URL = "sqlite:///db/users.db"
+
+# Index path and vector length of each gallery, as used by main.py
+GALLERIES = {
+    "face": ("db/face_index.ann", 512),
+    "voice": ("db/voice_index.ann", 192),
+}
+
+MEDIA_EXTENSIONS = {
+    "face": {".jpg", ".jpeg", ".png", ".bmp", ".webp"},
+    "voice": {".wav", ".flac", ".mp3", ".ogg"},
+}
+
+def shard_paths(index_path: str, num_shards: int) -> List[str]:
+    """
+    Gets the index files of a layout, as written by ShardedIndexManager.local.
+    """
+
+    if num_shards <= 1:
+        return [index_path]
+
+    root, ext = os.path.splitext(index_path)
+
+    return [f"{root}.shard{i}{ext}" for i in range(num_shards)]
+
+def detect_shards(index_path: str) -> int:
+    """
+    Detects how a gallery is stored on disk.
+
+    Returns:
+        int: The number of shards, 1 for a single index file, or 0 if nothing was written yet.
+
+    Raises:
+        ValueError: If both a single index and shards are on disk.
+    """
+
+    root, ext = os.path.splitext(index_path)
+    num_shards = 0
+
+    while any(os.path.exists(path) for path in index_files(f"{root}.shard{num_shards}{ext}")):
+        num_shards += 1
+
+    single = any(os.path.exists(path) for path in index_files(index_path))
+
+    if single and num_shards:
+        raise ValueError(f"Both {index_path} and {num_shards} shards of it are on disk, remove the stale layout first.")
+
+    return num_shards or int(single)
+
+def open_index(index_path: str, vector_length: int, backend: str = INDEX_BACKEND, num_trees: int = NUM_TREES, num_shards: int = 1, **backend_options):
+    """
+    Opens the index of a gallery the way main.py does. Opening never writes to disk.
+
+    Args:
+        index_path (str): The path to the index file, shard files are named after it.
+        vector_length (int): The length of the vectors to be indexed.
+        backend (str): The search engine, one of "exact", "quantized", "annoy" or "hnsw".
+        num_trees (int): The number of trees to build on the next rebuild.
+        num_shards (int): The number of shards, 1 opens a single index file.
+        **backend_options: Engine specific options, such as codec for quantized.
+
+    Returns:
+        AnnoyIndexManager or ShardedIndexManager: The index.
+    """
+
+    if num_shards > 1:
+        return ShardedIndexManager.local(index_path, vector_length, num_shards, backend=backend, num_trees=num_trees, **backend_options)
+
+    return AnnoyIndexManager(index_path, vector_length, backend=backend, num_trees=num_trees, **backend_options)
+
+def detect_backend(index_path: str, num_shards: int) -> Optional[Tuple[str, dict]]:
+    """
+    Detects the backend a gallery was saved with, from its first shard.
+
+    Returns:
+        Optional[Tuple[str, dict]]: The backend name and options, or None if nothing was recorded.
+    """
+
+    return read_backend(shard_paths(index_path, max(num_shards, 1))[0])
+
+def migrate(index_path: str, vector_length: int, backend: str, num_trees: int, num_shards: int, **backend_options) -> Tuple[object, Optional[List[str]]]:
+    """
+    Opens a gallery with num_shards shards, moving its users over from the layout on disk.
+
+    Every user's templates are read from the current layout, or their indexed
+    vector if they have none, and handed to the shard they belong to in the
+    new layout. Nothing is written until the index is rebuilt.
+
+    Returns:
+        AnnoyIndexManager or ShardedIndexManager: The index in the new layout.
+        Optional[List[str]]: The files of the old layout that the new one does not use, to delete after a successful rebuild. None if the layout does not change.
+    """
+
+    current = detect_shards(index_path)
+
+    if current in (0, num_shards):
+        return open_index(index_path, vector_length, backend, num_trees, num_shards, **backend_options), None
+
+    source = open_index(index_path, vector_length, backend, num_trees, current, **backend_options)
+    target = open_index(index_path, vector_length, backend, num_trees, num_shards, **backend_options)
+
+    for id in sorted(set(source.get_all_ids()) | set(source.get_index_ids())):
+        templates = source.get_templates(id)
+
+        if len(templates) > 0:
+            target.set_templates(id, templates)
+
+    kept = set(shard_paths(index_path, num_shards))
+    stale = [
+        file
+        for path in shard_paths(index_path, current) if path not in kept
+        for file in index_files(path) if os.path.exists(file)
+    ]
+
+    return target, stale
+
+def get_user_ids(database_url: str = DATABASE_URL) -> List[int]:
+    """
+    Gets the IDs of all users in the database.
+    """
+
+    with Session(create_engine(database_url)) as session:
+        return sorted(user.id for user in User.get_all_users(session))
+
+def rebuild(indexes: Dict[str, object], user_ids: List[int]) -> Dict[str, Tuple[bool, float]]:
+    """
+    Rebuilds all indexes in parallel.
+
+    Returns:
+        Dict[str, Tuple[bool, float]]: Whether each rebuild succeeded and how many seconds it took.
+    """
+
+    def run(index) -> Tuple[bool, float]:
+        start = time.perf_counter()
+        ok = index.rebuild(user_ids)
+
+        return ok, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(indexes)) as pool:
+        futures = {gallery: pool.submit(run, index) for gallery, index in indexes.items()}
+
+        return {gallery: future.result() for gallery, future in futures.items()}
+
+def verify(index, user_ids: List[int]) -> Dict[str, List[int]]:
+    """
+    Compares the users in an index with the users in the database.
+
+    The ids in the search index and the ids with stored templates are checked
+    separately, since users enrolled before templates were kept, or left
+    behind by a failed delete, only exist in one of them.
+
+    Returns:
+        Dict[str, List[int]]: The IDs in each kind of disagreement:
+            "missing": users in the database that are not in the index.
+            "orphaned": users in the index that are not in the database.
+            "without_templates": users in the index with no stored templates.
+            "not_indexed": users with stored templates that are not in the index.
+    """
+
+    db_ids = set(user_ids)
+    index_ids = set(index.get_index_ids())
+    template_ids = set(index.get_all_ids())
+
+    return {
+        "missing": sorted(db_ids - index_ids),
+        "orphaned": sorted(index_ids - db_ids),
+        "without_templates": sorted(index_ids - template_ids),
+        "not_indexed": sorted(template_ids - index_ids),
+    }
+
+def recall(index, user_ids: List[int], num_queries: int, k: int, seed: int = 0) -> Tuple[float, float, int]:
+    """
+    Measures the recall of an index against an exact scan over the same centroids.
+
+    Stored templates are used as queries, so no media is needed.
+
+    Returns:
+        float: The fraction of queries whose exact nearest centroid was found first.
+        float: The fraction of the exact top k that was found in the top k.
+        int: The number of queries.
+    """
+
+    templates = {id: index.get_templates(id) for id in user_ids}
+    templates = {id: t for id, t in templates.items() if len(t) > 0}
+
+    if not templates:
+        return 0.0, 0.0, 0
+
+    vector_length = next(iter(templates.values())).shape[1]
+    exact = ExactBackend(vector_length)
+
+    for id, t in templates.items():
+        exact.add_item(id, AnnoyIndexManager._centroid(t))
+
+    exact.build(0)
+
+    queries = [template for t in templates.values() for template in t]
+    queries = random.Random(seed).sample(queries, min(num_queries, len(queries)))
+
+    found, _ = index.get_ids_batch(queries, k)
+    truth, _ = exact.get_nns_by_vectors(queries, k)
+
+    hits_1 = sum(1 for f, t in zip(found, truth) if f[:1] == t[:1])
+    hits_k = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+
+    return hits_1 / len(queries), hits_k / sum(len(t) for t in truth), len(queries)
+
+def find_media(media_dir: str, gallery: str, user_ids: List[int]) -> Dict[int, List[str]]:
+    """
+    Finds the enrollment media of each user, laid out as <media_dir>/<user_id>/<gallery>/*.
+    """
+
+    media = {}
+
+    for id in user_ids:
+        directory = os.path.join(media_dir, str(id), gallery)
+
+        if not os.path.isdir(directory):
+            continue
+
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS[gallery]
+        )
+
+        if paths:
+            media[id] = paths
+
+    return media
+
+async def reembed(index, gallery: str, media: Dict[int, List[str]], batch_size: int, workers: int) -> Tuple[List[int], int]:
+    """
+    Recomputes the templates of every user from their media.
+
+    Batches are embedded with the batched model pipelines, with up to workers
+    batches in flight so the model executor stays busy. Templates are replaced
+    in memory only, call rebuild afterwards to move the centroids and save.
+
+    Returns:
+        List[int]: The IDs of the users whose templates were replaced.
+        int: The number of files that could not be embedded.
+    """
+
+    if gallery == "face":
+        import src.face_bio as bio
+    else:
+        import src.voice_bio as bio
+
+    items = [(id, path) for id, paths in media.items() for path in paths]
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    semaphore = asyncio.Semaphore(workers)
+
+    async def embed(batch):
+        async with semaphore:
+            return await bio.get_embeddings_batch([path for _, path in batch])
+
+    results = await asyncio.gather(*(embed(batch) for batch in batches))
+
+    templates = {}
+    failed = 0
+
+    for batch, embs in zip(batches, results):
+        for (id, _), emb in zip(batch, embs):
+            if len(emb) == 0:
+                failed += 1
+                continue
+
+            templates.setdefault(id, []).append(emb)
+
+    for id, embs in templates.items():
+        index.set_templates(id, embs)
+
+    return sorted(templates), failed
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline maintenance of the face and voice indexes.")
+
+    # Options shared by every command, given after the command name
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--gallery", choices=["face", "voice", "both"], default="both")
+    common.add_argument("--backend", help="Search engine, defaults to the one the index was saved with. rebuild and reembed convert the index to another engine, verify and recall refuse a different one.")
+    common.add_argument("--shards", type=int, help="Number of shards each gallery is partitioned across, defaults to the layout on disk. rebuild and reembed move the users to a new shard count.")
+    common.add_argument("--database", default=DATABASE_URL)
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild", parents=[common], help="Rebuild and compact the indexes from the stored templates.")
+    rebuild_parser.add_argument("--num-trees", type=int, default=NUM_TREES)
+
+    commands.add_parser("verify", parents=[common], help="Check the indexed users against the database.")
+
+    recall_parser = commands.add_parser("recall", parents=[common], help="Measure recall against an exact scan.")
+    recall_parser.add_argument("--queries", type=int, default=1000)
+    recall_parser.add_argument("--k", type=int, default=5)
+
+    reembed_parser = commands.add_parser("reembed", parents=[common], help="Recompute all templates from the enrollment media.")
+    reembed_parser.add_argument("--media-dir", required=True, help="Directory laid out as <user_id>/face/* and <user_id>/voice/*.")
+    reembed_parser.add_argument("--batch-size", type=int, default=32)
+    reembed_parser.add_argument("--workers", type=int, default=4, help="Number of batches in flight at once.")
+    reembed_parser.add_argument("--num-trees", type=int, default=NUM_TREES)
+    reembed_parser.add_argument("--allow-partial", action="store_true", help="Rebuild even if some users could not be re-embedded and keep their old templates.")
+
+    args = parser.parse_args(argv)
+
+    galleries = list(GALLERIES) if args.gallery == "both" else [args.gallery]
+    num_trees = getattr(args, "num_trees", NUM_TREES)
+
+    indexes = {}
+    stale = {}
+
+    for gallery in galleries:
+        index_path, vector_length = GALLERIES[gallery]
+        num_shards = detect_shards(index_path) or 1
+        recorded = detect_backend(index_path, num_shards)
+
+        if recorded and args.backend in (None, recorded[0]):
+            backend, options = recorded
+        else:
+            backend, options = args.backend or INDEX_BACKEND, {}
+
+        if args.command in ("rebuild", "reembed"):
+            indexes[gallery], old_files = migrate(index_path, vector_length, backend, num_trees, args.shards or num_shards, **options)
+
+            if old_files is not None:
+                stale[gallery] = old_files
+        elif args.shards and args.shards != num_shards:
+            parser.error(f"{index_path} has {num_shards} shards, run rebuild --shards {args.shards} to change that.")
+        elif recorded and backend != recorded[0]:
+            parser.error(f"{index_path} was saved with the {recorded[0]} backend, run rebuild --backend {backend} to convert it.")
+        else:
+            indexes[gallery] = open_index(index_path, vector_length, backend, num_trees, num_shards, **options)
+
+    user_ids = get_user_ids(args.database)
+
+    if args.command == "verify":
+        for gallery, index in indexes.items():
+            problems = verify(index, user_ids)
+
+            print(f"{gallery}: {len(user_ids)} users, " + ", ".join(f"{len(ids)} {kind.replace('_', ' ')}" for kind, ids in problems.items()))
+
+            for kind, ids in problems.items():
+                if ids:
+                    print(f"  {kind.replace('_', ' ')}: {ids}")
+
+        return
+
+    if args.command == "recall":
+        for gallery, index in indexes.items():
+            recall_1, recall_k, num_queries = recall(index, user_ids, args.queries, args.k)
+
+            print(f"{gallery}: {num_queries} queries, recall@1 {recall_1:.4f}, recall@{args.k} {recall_k:.4f}")
+
+        return
+
+    if args.command == "reembed":
+        partial = False
+
+        for gallery, index in indexes.items():
+            media = find_media(args.media_dir, gallery, user_ids)
+
+            start = time.perf_counter()
+            reembedded, failed = asyncio.run(reembed(index, gallery, media, args.batch_size, args.workers))
+
+            print(f"{gallery}: re-embedded {len(reembedded)} users in {time.perf_counter() - start:.1f}s, {failed} files failed")
+
+            # Users without usable media would keep templates from the old model, which the new one cannot match
+            skipped = sorted(set(user_ids) - set(reembedded))
+
+            if skipped:
+                partial = True
+                print(f"{gallery}: {len(skipped)} users were not re-embedded: {skipped}")
+
+        if partial and not args.allow_partial:
+            parser.exit(1, "Not rebuilding, since some users would keep their old templates. Add their media or pass --allow-partial.\n")
+
+    # Changing the layout must not leave users behind, so it is refused before anything is written
+    for gallery in stale:
+        missing = sorted(set(user_ids) - set(indexes[gallery].get_all_ids()))
+
+        if missing:
+            parser.exit(1, f"{gallery}: {len(missing)} users are not in the current layout, not changing the number of shards: {missing}\n")
+
+    results = rebuild(indexes, user_ids)
+
+    for gallery, (ok, seconds) in results.items():
+        print(f"{gallery}: {'rebuilt' if ok else 'failed to rebuild'} {len(indexes[gallery].get_all_ids())} users in {seconds:.1f}s")
+
+        if ok and stale.get(gallery):
+            for path in stale[gallery]:
+                os.remove(path)
+
+            print(f"{gallery}: removed {len(stale[gallery])} files of the previous layout")
+
+    if not all(ok for ok, _ in results.values()):
+        parser.exit(1)
+
+if __name__ == "__main__":
+    main()
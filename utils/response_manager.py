@@ -1,25 +1,57 @@
-from typing import Optional, Union
+from typing import Any, Dict, Optional, Union
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
 from .errors import Error
 
+def _default(obj: Any) -> Any:
+    # Fallback for objects orjson cannot serialize natively, such as SQLModel rows
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    An ORJSONResponse that also serializes pydantic and SQLModel objects.
+
+    Endpoints should pass plain dicts, e.g. User.to_dict(), to stay on orjson's fast path.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
 class ResponseManager:
     @staticmethod
-    def error_response(error: Error, message: str) -> dict:
+    def error_body(error: Error, message: str) -> dict:
         return {
             "success": False,
             "error": {
                 "code": error.code,
                 "message": message
             }
-        }, error.http_status
-
-    @staticmethod
-    def get_error_response(error: Error) -> dict:
-        default_message = "Unknown error occurred."
-        return ResponseManager.error_response(error, error.message)
+        }
 
     @staticmethod
-    def success_response(data: Optional[Union[dict, list]] = None) -> dict:
+    def success_body(data: Optional[Union[dict, list]] = None) -> dict:
         return {
             "success": True,
             "data": data
-        }, 200
\ No newline at end of file
+        }
+
+    @staticmethod
+    def error_response(error: Error, message: str, headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+        return FastJSONResponse(ResponseManager.error_body(error, message), status_code=error.http_status, headers=headers)
+
+    @staticmethod
+    def get_error_response(error: Error, headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+        return ResponseManager.error_response(error, error.message, headers)
+
+    @staticmethod
+    def unavailable_response(retry_after: int) -> FastJSONResponse:
+        return ResponseManager.get_error_response(Error.SERVICE_UNAVAILABLE, {"Retry-After": str(retry_after)})
+
+    @staticmethod
+    def success_response(data: Optional[Union[dict, list]] = None) -> FastJSONResponse:
+        return FastJSONResponse(ResponseManager.success_body(data), status_code=200)
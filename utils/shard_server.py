@@ -0,0 +1,180 @@
+"""
+Serves one index shard to other processes over multiprocessing.connection.
+
+Start a shard server with:
+
+    SHARD_AUTHKEY=secret python -m utils.shard_server --port 6000 --index db/face_index.shard0.ann --dim 512
+
+and point ShardedIndexManager.remote at the servers in shard order.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+
+from typing import List, Optional, Tuple
+
+# Only these AnnoyIndexManager methods can be called remotely
+METHODS = {
+    "add",
+    "add_template",
+    "delete",
+    "rebuild",
+    "set_templates",
+    "get_all_ids",
+    "get_index_ids",
+    "get_ids",
+    "get_ids_batch",
+    "get_vectors",
+    "get_templates",
+    "rescore",
+    "__sizeof__",
+}
+
+def serve_shard(address: Tuple[str, int],
+                authkey: bytes,
+                index_path: str,
+                vector_length: int,
+                ready=None,
+                **manager_options) -> None:
+    """
+    Serves an AnnoyIndexManager until the process is stopped.
+
+    Every connection is handled on its own thread. Calls are serialized with a
+    lock, since shards rebuild their index in place on writes.
+
+    Args:
+        address (Tuple[str, int]): The (host, port) to listen on, port 0 picks a free port.
+        authkey (bytes): The key clients must present.
+        index_path (str): The path to the shard's index file.
+        vector_length (int): The length of the vectors to be indexed.
+        ready (Optional[Queue]): Receives the bound address once the server accepts connections.
+        **manager_options: Options passed on to AnnoyIndexManager, such as backend.
+    """
+
+    from .annoy_index_manager import AnnoyIndexManager
+
+    manager = AnnoyIndexManager(index_path, vector_length, **manager_options)
+    lock = threading.Lock()
+
+    def handle(conn) -> None:
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except EOFError:
+                    return
+
+                if method not in METHODS:
+                    conn.send(("error", f"Unknown method: {method}"))
+                    continue
+
+                try:
+                    with lock:
+                        result = getattr(manager, method)(*args, **kwargs)
+
+                    conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.put(listener.address)
+
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+class RemoteShard:
+    """
+    Client for a shard served by serve_shard, with the same methods as AnnoyIndexManager.
+
+    Each calling thread keeps its own connection, so the fan-out thread pool of
+    ShardedIndexManager can query shards concurrently.
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.local = threading.local()
+
+    def _call(self, method: str, *args, **kwargs):
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self.local.conn = conn
+
+        try:
+            conn.send((method, args, kwargs))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # Reconnect on the next call if the server went away
+            self.local.conn = None
+            raise
+
+        if status == "error":
+            raise RuntimeError(f"Shard {self.address} failed {method}: {result}")
+
+        return result
+
+    def add(self, id: int, vector: List[float], all_ids: List[int]) -> bool:
+        return self._call("add", id, vector, all_ids)
+
+    def add_template(self, id: int, vector: List[float], all_ids: List[int]) -> bool:
+        return self._call("add_template", id, vector, all_ids)
+
+    def delete(self, id: int, all_ids: List[int]) -> bool:
+        return self._call("delete", id, all_ids)
+
+    def rebuild(self, all_ids: List[int]) -> bool:
+        return self._call("rebuild", all_ids)
+
+    def set_templates(self, id: int, templates: List[List[float]]) -> None:
+        return self._call("set_templates", id, templates)
+
+    def get_all_ids(self) -> List[int]:
+        return self._call("get_all_ids")
+
+    def get_index_ids(self) -> List[int]:
+        return self._call("get_index_ids")
+
+    def get_ids(self, vector: List[float], num_results: int = 1):
+        return self._call("get_ids", vector, num_results)
+
+    def get_ids_batch(self, vectors: List[List[float]], num_results: int = 1):
+        return self._call("get_ids_batch", vectors, num_results)
+
+    def get_vectors(self, ids: int) -> List[float]:
+        return self._call("get_vectors", ids)
+
+    def get_templates(self, id: int):
+        return self._call("get_templates", id)
+
+    def rescore(self, vector: List[float], ids: List[int]):
+        return self._call("rescore", vector, ids)
+
+    def __sizeof__(self) -> int:
+        return self._call("__sizeof__")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve one index shard.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--index", required=True, help="Path to the shard's index file.")
+    parser.add_argument("--dim", type=int, required=True, help="Length of the indexed vectors.")
+    parser.add_argument("--backend", default="annoy")
+    args = parser.parse_args(argv)
+
+    authkey = os.environ.get("SHARD_AUTHKEY")
+
+    if not authkey:
+        parser.error("Set SHARD_AUTHKEY to the key shared with the API server.")
+
+    serve_shard((args.host, args.port), authkey.encode(), args.index, args.dim, backend=args.backend)
+
+if __name__ == "__main__":
+    main()
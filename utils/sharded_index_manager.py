@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .annoy_index_manager import AnnoyIndexManager
+from .shard_server import RemoteShard
+
+from typing import Dict, List, Tuple
+
+NUM_SHARDS = 4
+SHARD_SIZE = 100000
+
+class ShardedIndexManager:
+    """
+    Partitions a gallery across several index shards behind the AnnoyIndexManager API.
+
+    Every user lives on exactly one shard, chosen by hash (id modulo the number
+    of shards) or by id range (SHARD_SIZE consecutive ids per shard). Writes go
+    to that shard only, so each shard rebuilds and saves on its own. Searches
+    fan out to all shards in parallel and the results are merged by distance.
+
+    Shards are AnnoyIndexManager instances in this process, or RemoteShard
+    clients for shards served by other processes with utils.shard_server.
+    """
+
+    def __init__(self, shards: List, partition: str = "hash", shard_size: int = SHARD_SIZE):
+        """
+        Initializes the ShardedIndexManager.
+
+        Args:
+            shards (List): The shards, AnnoyIndexManager or RemoteShard instances.
+            partition (str): How ids are assigned to shards, "hash" or "range".
+            shard_size (int): The number of consecutive ids per shard for range partitioning.
+        """
+
+        if partition not in ("hash", "range"):
+            raise ValueError(f"Unknown partition: {partition}. Choose hash or range.")
+
+        self.shards = shards
+        self.partition = partition
+        self.shard_size = shard_size
+
+        self.executor = ThreadPoolExecutor(max_workers=len(shards))
+
+    @classmethod
+    def local(cls,
+              index_path: str,
+              vector_length: int,
+              num_shards: int = NUM_SHARDS,
+              partition: str = "hash",
+              shard_size: int = SHARD_SIZE,
+              **manager_options) -> ShardedIndexManager:
+        """
+        Creates a sharded index with every shard in this process.
+
+        Shard i is stored next to index_path, e.g. db/face_index.shard0.ann.
+
+        Args:
+            index_path (str): The path the shard file names are derived from.
+            vector_length (int): The length of the vectors to be indexed.
+            num_shards (int): The number of shards.
+            partition (str): How ids are assigned to shards, "hash" or "range".
+            shard_size (int): The number of consecutive ids per shard for range partitioning.
+            **manager_options: Options passed on to every AnnoyIndexManager, such as backend.
+
+        Returns:
+            ShardedIndexManager: The sharded index.
+        """
+
+        root, ext = os.path.splitext(index_path)
+
+        shards = [
+            AnnoyIndexManager(f"{root}.shard{i}{ext}", vector_length, **manager_options)
+            for i in range(num_shards)
+        ]
+
+        return cls(shards, partition, shard_size)
+
+    @classmethod
+    def remote(cls,
+               addresses: List[Tuple[str, int]],
+               authkey: bytes,
+               partition: str = "hash",
+               shard_size: int = SHARD_SIZE) -> ShardedIndexManager:
+        """
+        Creates a sharded index whose shards are served by other processes.
+
+        Args:
+            addresses (List[Tuple[str, int]]): The (host, port) of each shard server, in shard order.
+            authkey (bytes): The key shared with the shard servers.
+            partition (str): How ids are assigned to shards, "hash" or "range".
+            shard_size (int): The number of consecutive ids per shard for range partitioning.
+
+        Returns:
+            ShardedIndexManager: The sharded index.
+        """
+
+        return cls([RemoteShard(address, authkey) for address in addresses], partition, shard_size)
+
+    def shard_for(self, id: int) -> int:
+        """
+        Gets the shard a user lives on.
+
+        Args:
+            id (int): The ID of the user.
+
+        Returns:
+            int: The index of the shard.
+        """
+
+        if self.partition == "range":
+            return min(id // self.shard_size, len(self.shards) - 1)
+
+        return id % len(self.shards)
+
+    def _shard_ids(self, shard: int, all_ids: List[int]) -> List[int]:
+        return [i for i in all_ids if self.shard_for(i) == shard]
+
+    def _group_by_shard(self, ids: List[int]) -> Dict[int, List[int]]:
+        groups = {}
+
+        for i in ids:
+            groups.setdefault(self.shard_for(i), []).append(i)
+
+        return groups
+
+    def add(self, id: int, vector: List[float], all_ids: List[int]) -> bool:
+        """
+        Adds a vector to the shard of the given ID.
+
+        Args:
+            id (int): The ID of the vector.
+            vector (List[float]): The vector to be added to the index.
+            all_ids (List[int]): The IDs of all users currently in the index.
+        """
+
+        shard = self.shard_for(id)
+
+        return self.shards[shard].add(id, vector, self._shard_ids(shard, all_ids))
+
+    def add_template(self, id: int, vector: List[float], all_ids: List[int]) -> bool:
+        """
+        Adds another template for an existing user on their shard.
+
+        Args:
+            id (int): The ID of the user.
+            vector (List[float]): The template to add.
+            all_ids (List[int]): The IDs of all users currently in the index.
+        """
+
+        shard = self.shard_for(id)
+
+        return self.shards[shard].add_template(id, vector, self._shard_ids(shard, all_ids))
+
+    def delete(self, id: int, all_ids: List[int]) -> bool:
+        """
+        Deletes a vector from the shard of the given ID.
+
+        Args:
+            id (int): The ID of the vector to be deleted.
+            all_ids (List[int]): The IDs of all users currently in the index.
+        """
+
+        shard = self.shard_for(id)
+
+        return self.shards[shard].delete(id, self._shard_ids(shard, all_ids))
+
+    def rebuild(self, all_ids: List[int]) -> bool:
+        """
+        Rebuilds every shard from scratch, in parallel.
+
+        Args:
+            all_ids (List[int]): The IDs of all users that should be in the index.
+        """
+
+        results = self.executor.map(lambda i: self.shards[i].rebuild(self._shard_ids(i, all_ids)), range(len(self.shards)))
+
+        return all(list(results))
+
+    def set_templates(self, id: int, templates: List[List[float]]) -> None:
+        """
+        Replaces all templates of a user on their shard without touching the index.
+        """
+
+        self.shards[self.shard_for(id)].set_templates(id, templates)
+
+    def get_all_ids(self) -> List[int]:
+        """
+        Gets the IDs of all users with stored templates, across all shards.
+        """
+
+        return sorted(id for ids in self.executor.map(lambda shard: shard.get_all_ids(), self.shards) for id in ids)
+
+    def get_index_ids(self) -> List[int]:
+        """
+        Gets the IDs of all users in the shard indexes, with or without stored templates.
+        """
+
+        return sorted(id for ids in self.executor.map(lambda shard: shard.get_index_ids(), self.shards) for id in ids)
+
+    def get_ids(self, vector: List[float], num_results: int = 1) -> Tuple[List[int], List[float]]:
+        """
+        Gets the IDs of the nearest vectors across all shards.
+
+        Args:
+            vector (List[float]): The vector to search for.
+            num_results (int): The number of results to return.
+
+        Returns:
+            List[int]: The IDs of the nearest vectors.
+            List[float]: The distances to the nearest vectors.
+        """
+
+        results = self.executor.map(lambda shard: shard.get_ids(vector, num_results), self.shards)
+
+        return self._merge(list(results), num_results)
+
+    def get_ids_batch(self, vectors: List[List[float]], num_results: int = 1) -> Tuple[List[List[int]], List[List[float]]]:
+        """
+        Gets the IDs of the nearest vectors to each of the given vectors across all shards.
+
+        Args:
+            vectors (List[List[float]]): The vectors to search for.
+            num_results (int): The number of results to return per vector.
+
+        Returns:
+            List[List[int]]: The IDs of the nearest vectors, one list per query vector.
+            List[List[float]]: The distances to the nearest vectors, one list per query vector.
+        """
+
+        results = list(self.executor.map(lambda shard: shard.get_ids_batch(vectors, num_results), self.shards))
+
+        all_ids = []
+        all_dists = []
+
+        for q in range(len(vectors)):
+            ids, dists = self._merge([(shard_ids[q], shard_dists[q]) for shard_ids, shard_dists in results], num_results)
+
+            all_ids.append(ids)
+            all_dists.append(dists)
+
+        return all_ids, all_dists
+
+    @staticmethod
+    def _merge(results: List[Tuple[List[int], List[float]]], num_results: int) -> Tuple[List[int], List[float]]:
+        """
+        Merges per-shard nearest neighbours into a global top num_results, closest first.
+        """
+
+        pairs = sorted((dist, id) for ids, dists in results for id, dist in zip(ids, dists))[:num_results]
+
+        return [id for _, id in pairs], [dist for dist, _ in pairs]
+
+    def get_vectors(self, ids: int) -> List[float]:
+        """
+        Gets the indexed vector of the given ID from its shard.
+        """
+
+        return self.shards[self.shard_for(ids)].get_vectors(ids)
+
+    def get_templates(self, id: int) -> np.ndarray:
+        """
+        Gets all templates of a user from their shard.
+        """
+
+        return self.shards[self.shard_for(id)].get_templates(id)
+
+    def rescore(self, vector: List[float], ids: List[int]) -> Tuple[List[int], List[float]]:
+        """
+        Re-scores candidate users against all of their templates, on their own shards.
+
+        Args:
+            vector (List[float]): The query vector.
+            ids (List[int]): The candidate IDs, usually from get_ids.
+
+        Returns:
+            List[int]: The candidate IDs, best match first.
+            List[float]: The cosine similarity of each candidate's best template.
+        """
+
+        groups = self._group_by_shard(ids)
+        results = self.executor.map(lambda item: self.shards[item[0]].rescore(vector, item[1]), groups.items())
+
+        pairs = sorted(((-score, id) for shard_ids, scores in results for id, score in zip(shard_ids, scores)))
+
+        return [id for _, id in pairs], [-score for score, _ in pairs]
+
+    def __sizeof__(self) -> int:
+        """
+        Returns the total size of all shards.
+        """
+
+        return sum(shard.__sizeof__() for shard in self.shards)
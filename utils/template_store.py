@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import os
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from typing import Dict, Iterator, List, Set
+
+class TemplateStore(MutableMapping):
+    """
+    The enrollment templates of every user, as a mapping from user ID to an array of templates.
+
+    Saved templates are memory-mapped from disk, so reading the templates of a
+    few candidates only pages in their rows and the gallery does not have to
+    fit in memory. Templates set or deleted since the last save are kept in
+    memory until the next save.
+
+    Two files are written: <root>.templates.npy holds the vectors, grouped by
+    user in ID order, and <root>.templates_ids.npy the owner of each row.
+    Templates saved by earlier versions in <root>.templates.npz are read into
+    memory and moved to the new files on the next save.
+
+    Attributes:
+        path (str): The path to the vectors file.
+        vector_length (int): The length of the templates.
+        dtype (np.dtype): The precision templates are stored and returned in.
+    """
+
+    def __init__(self, path: str, vector_length: int, dtype: str = "float32") -> None:
+        self.path = path
+        self.ids_path, self.legacy_path = TemplateStore.files(path)[1:]
+        self.vector_length = vector_length
+        self.dtype = np.dtype(dtype)
+
+        # Replaced as a whole on save, so readers never mix rows of two files
+        self.disk = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), None)
+
+        self.changed: Dict[int, np.ndarray] = {}
+        self.removed: Set[int] = set()
+
+    @staticmethod
+    def files(path: str) -> List[str]:
+        """
+        Gets the files of a store: the vectors, the row owners and the legacy npz file.
+        """
+
+        root = os.path.splitext(path)[0]
+
+        return [path, root + "_ids.npy", root + ".npz"]
+
+    def load(self) -> None:
+        """
+        Maps the saved templates.
+        """
+
+        if os.path.exists(self.path):
+            owners = np.load(self.ids_path)
+            vectors = np.load(self.path, mmap_mode="r")
+
+            if len(owners) != len(vectors):
+                raise ValueError(f"{self.ids_path} has {len(owners)} rows but {self.path} has {len(vectors)}.")
+
+            ids, starts, counts = np.unique(owners, return_index=True, return_counts=True)
+
+            self.disk = (ids, starts, starts + counts, vectors)
+        elif os.path.exists(self.legacy_path):
+            data = np.load(self.legacy_path)
+
+            # Group the rows by user with one sort instead of one scan per user
+            order = np.argsort(data["ids"], kind="stable")
+            ids, starts = np.unique(data["ids"][order], return_index=True)
+            groups = np.split(data["vectors"][order].astype(self.dtype, copy=False), starts[1:])
+
+            self.changed = {int(id): group for id, group in zip(ids, groups)}
+
+    def save(self) -> None:
+        """
+        Writes every template to new files and maps them in place of the old ones.
+        """
+
+        ids = sorted(self)
+        counts = [len(self[id]) for id in ids]
+
+        owners = np.repeat(np.asarray(ids, dtype=np.int64), counts)
+
+        # Written next to the old files and moved over them, so the old mapping stays valid until the swap
+        tmp_path = self.path + ".tmp.npy"
+        tmp_ids_path = self.ids_path + ".tmp.npy"
+
+        vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(len(owners), self.vector_length))
+        row = 0
+
+        for id, count in zip(ids, counts):
+            vectors[row:row + count] = self[id]
+            row += count
+
+        vectors.flush()
+        del vectors
+
+        np.save(tmp_ids_path, owners)
+
+        os.replace(tmp_ids_path, self.ids_path)
+        os.replace(tmp_path, self.path)
+
+        if os.path.exists(self.legacy_path):
+            os.remove(self.legacy_path)
+
+        self.changed = {}
+        self.removed = set()
+        self.load()
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory held outside the mapped file: the row index and the unsaved templates.
+        """
+
+        ids, starts, ends, _ = self.disk
+
+        return ids.nbytes + starts.nbytes + ends.nbytes + sum(t.nbytes for t in self.changed.values())
+
+    def _find(self, id: int):
+        ids, starts, ends, vectors = self.disk
+        i = np.searchsorted(ids, id)
+
+        if i < len(ids) and ids[i] == id:
+            return vectors, starts[i], ends[i]
+
+        return None
+
+    def __getitem__(self, id: int) -> np.ndarray:
+        if id in self.changed:
+            return self.changed[id]
+
+        found = None if id in self.removed else self._find(id)
+
+        if found is None:
+            raise KeyError(id)
+
+        vectors, start, end = found
+
+        return np.array(vectors[start:end], dtype=self.dtype)
+
+    def __setitem__(self, id: int, templates: np.ndarray) -> None:
+        self.changed[id] = np.asarray(templates, dtype=self.dtype)
+        self.removed.discard(id)
+
+    def __delitem__(self, id: int) -> None:
+        if id not in self:
+            raise KeyError(id)
+
+        self.changed.pop(id, None)
+
+        if self._find(id) is not None:
+            self.removed.add(id)
+
+    def __contains__(self, id) -> bool:
+        if id in self.changed:
+            return True
+
+        return id not in self.removed and self._find(id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        for id in self.disk[0].tolist():
+            if id not in self.changed and id not in self.removed:
+                yield id
+
+        yield from list(self.changed)
+
+    def __len__(self) -> int:
+        saved = sum(1 for id in self.disk[0].tolist() if id not in self.changed and id not in self.removed)
+
+        return saved + len(self.changed)
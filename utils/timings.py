@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from typing import Dict, Iterator, Optional
+
+# Stage timings of the current request, None outside of a request
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+def start() -> Dict[str, float]:
+    """
+    Starts recording stage timings for the current request.
+
+    Tasks started afterwards, e.g. by asyncio.gather, record into the same timings.
+
+    Returns:
+        Dict[str, float]: The timings, in seconds per stage.
+    """
+
+    timings = {}
+    _timings.set(timings)
+
+    return timings
+
+def record(stage: str, seconds: float) -> None:
+    """
+    Adds the duration of a stage to the current request's timings.
+
+    Does nothing outside of a request, so model code can be timed unconditionally.
+    """
+
+    timings = _timings.get()
+
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Records how long the enclosed block takes as the given stage.
+    """
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """
+    Formats timings as a Server-Timing header value, in milliseconds.
+    """
+
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())